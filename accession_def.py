@@ -0,0 +1,122 @@
+"""
+Accessions as they are matched between datasets (bands, pull-downs, several pull-downs).
+
+The same protein is not always written the same way : 'sp|P9WGR1|CLPB_MYCTU' (UniProt fasta header),
+'P9WGR1' (accession alone), 'P9WGR1-2' (isoform), depending on the search settings of each file.
+-> canonical ID of an accession, by match level :
+   'exact' : the accession as written (no parsing)
+   'accession' : the UniProt accession of the header ('sp|' / 'tr|' prefix and entry name removed), isoforms kept
+   'protein' (default) : also without the isoform number, every isoform of a protein matches
+   accessions that are not UniProt ones are matched as written (without surrounding spaces)
+-> AccessionIndex : the accessions of a group of datasets factorized together, each distinct accession parsed once,
+   then every row coded by its canonical ID : band - band and band - pull-down joins are array lookups on these codes
+"""
+
+import re
+
+import numpy as np
+import pandas as pd
+
+
+MATCHES = ('exact', 'accession', 'protein')
+DEFAULT_MATCH = 'protein'
+
+# UniProt accession format (see uniprot.org/help/accession_numbers)
+UNIPROT = r'(?:[OPQ][0-9][A-Z0-9]{3}[0-9]|[A-NR-Z][0-9](?:[A-Z][A-Z0-9]{2}[0-9]){1,2})'
+# optional 'sp|' / 'tr|', the accession and its optional isoform number, then the end, the entry name or a description
+PARSE = re.compile(r'\s*(?:(?:sp|tr)\|)?('+UNIPROT+r')(-\d+)?(?=[|\s]|$)')
+
+
+
+def check_match(match):
+    if match not in MATCHES:
+        raise ValueError('Unknown accession match "'+str(match)+'" ('+', '.join(MATCHES)+').')
+    return(match)
+
+
+
+def canonical_ids(accessions, match=DEFAULT_MATCH):
+    # canonical ID of each accession (object array), see this module's description
+    values = np.asarray(accessions, dtype=object)
+    if check_match(match) == 'exact':
+        return(values)
+
+    ids = []
+    for value in values:
+        found = PARSE.match(value) if type(value) is str else None
+        if found is None:
+            # not a UniProt accession (or not text) : as written
+            ids.append(value.strip() if type(value) is str else value)
+        elif match == 'protein':
+            ids.append(found[1])
+        else:
+            ids.append(found[1]+(found[2] or ''))
+    return(np.array(ids, dtype=object))
+
+
+
+def canonical(accessions, match=DEFAULT_MATCH):
+    # canonical_ids of a column, each distinct accession parsed once (a Series, same index, missing stay missing)
+    acc = pd.Series(accessions)
+    codes, uniques = pd.factorize(acc)
+    ids = np.append(canonical_ids(uniques, match), np.nan)
+    return(pd.Series(ids[codes], index=acc.index, name=acc.name, dtype=object))
+
+
+
+class AccessionIndex:
+    '''
+    canonical ID -> rows of each dataset, built once for a group of datasets (all with an 'accession' column)
+    ids : the canonical IDs, in order of first appearance, labels : the first accession written for each ID
+    (shown in the results instead of the ID, so that exact matches show the accessions as they were)
+    codes[k] : position in ids of each row of the k-th dataset (-1 : missing accession, never matched)
+    '''
+
+    def __init__(self, frames, match=DEFAULT_MATCH):
+        self.match = check_match(match)
+        frames = list(frames)
+        self.sizes = [len(df) for df in frames]
+        acc = pd.concat([df['accession'] for df in frames], ignore_index=True) if frames else pd.Series([], dtype=object)
+
+        # distinct accessions as written (shared categories : the categories used), then their distinct IDs
+        acc_codes, written = pd.factorize(acc)
+        written = np.asarray(written, dtype=object)
+        id_codes, ids = pd.factorize(canonical_ids(written, match))
+        self.ids = np.asarray(ids, dtype=object)
+        self.labels = written[np.unique(id_codes, return_index=True)[1]]
+
+        codes = np.append(id_codes, -1)[acc_codes]
+        self.codes = np.split(codes, np.cumsum(self.sizes)[:-1]) if frames else []
+
+
+    def __len__(self):
+        return(len(self.ids))
+
+
+    def presence(self):
+        # ID x dataset boolean matrix (numpy)
+        P = np.zeros((len(self.ids), len(self.codes)), dtype=bool)
+        for k, codes in enumerate(self.codes):
+            P[codes[codes >= 0], k] = True
+        return(P)
+
+
+    def found_in(self, k, other):
+        # row mask of the k-th dataset : rows whose ID is also in the other-th dataset
+        present = np.zeros(len(self.ids)+1, dtype=bool) # the last one for the missing accessions
+        codes = self.codes[other]
+        present[codes[codes >= 0]] = True
+        return(present[self.codes[k]])
+
+
+    def lookup(self, accessions):
+        # position in ids of any accessions (parsed the same way), -1 if the ID is in none of the datasets
+        return(pd.Index(self.ids).get_indexer(canonical(accessions, self.match)))
+
+
+    def rows(self, accession, k):
+        # row positions of the k-th dataset matching an accession (any of its written forms)
+        code = self.lookup([accession])[0]
+        if code < 0:
+            return(np.array([], dtype=int))
+        return(np.flatnonzero(self.codes[k] == code))
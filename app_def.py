@@ -28,9 +28,6 @@ Lea Masson
 
 import tkinter as tk 
 from tkinter import messagebox
-from PIL import Image, ImageTk
-import base64
-import io
 
 
 
@@ -65,7 +62,8 @@ def description():
     description = '''This program helps you cross-results your excels from protein migration band's identification and pull down to 
 
 From your excel files, it : 
-    → Removed contaminants
+    → Removed contaminants (mycobacterial proteins kept by default, other rule sets in rules.json :
+       PROTEOCROSS_RULES=<rule set> in the environment before starting the app)
     → Applies given molecular weight cut offs
     → Compares proteins between datasets (bands-bands, pulldown-bands)
     → Plots a volcano plot from the pull-down results, highlighting the protein.s found in the band.s
@@ -100,15 +98,40 @@ Modules and librairies required :
     - itertools
     - numpy 1.24.2
     - matplotlib.pyplot 3.7.1
+    - openpyxl (excel files)
+    - optional, for faster reading : python-calamine, pyarrow
+    - optional, for faster writing : xlsxwriter
     
 
-The code is divided in three python files :
+The code is divided in these python files :
     - auto_prot_app.py
         contains the Tkinter GUI, and hopefully will run the automation
     - app_def.py 
         contains funtions necessary to the "menu"'s buttons, can be copy / pasted to the main code without many problems
     - auto_prot_def.py
-        contains all the functions to automate the given proteomics data treatment. Functions are called in auto_prot_app to pass prints as tkinter labels. 
+        contains the functions that ask for the data and pass the prints / tables / plots as tkinter widgets. 
+    - pipeline_def.py
+        contains all the functions to automate the given proteomics data treatment, without any display.
+    - ingest_def.py, rules_def.py (+ rules.json)
+        reading of the excel files, contaminants' rule sets
+    - output_def.py, volcano_def.py
+        writing of the results tables (excel, csv, parquet), volcano plots
+    - comparison_def.py
+        comparison of several pull-downs (enrichment matrix, UpSet-style intersections)
+    - accession_def.py
+        accessions matched between datasets (UniProt headers, isoforms)
+    - store_def.py, proteostore.py
+        results store (SQLite, sqlite3 from python) of every run, and its command line to search it
+    - stage_cache_def.py
+        results of each step saved and loaded again when their inputs did not change
+    - table_def.py
+        results tables displayed in the app (scrolling, sorting and search)
+    - profiling_def.py
+        time, memory and rows of each step, 'Analysis log.json'
+    - benchmark.py, synthetic_def.py
+        timing of each step on synthetic data
+    - proteocross.py
+        command line : runs the same treatment from a json manifest, without any window
 
 The logo is encoded in UTF-8 and display as such. 
 '''
@@ -0,0 +1,263 @@
+"""
+Benchmark of every stage of the pipeline on synthetic data (see synthetic_def.py), without any window.
+
+    python benchmark.py [--rows 1000 10000 100000] [--bands 2 10 50] [--stages ...] [--repeat 3]
+                        [--species MYCTU=0.55 HUMAN=0.45] [--mw-median 40000] [--mw-sigma 0.6]
+                        [--out results.json] [--compare old_results.json] [--imports]
+
+The synthetic proteome (see synthetic_def.proteome) can be changed : --species gives the species suffixes and
+their share of the proteins (the share of contaminants), --mw-median / --mw-sigma the MW distribution (the share
+of proteins kept by the MW cut-offs).
+
+Stages timed separately (each on the same synthetic bands and pull-down) :
+ - ingest : reading of a "Protein sets" excel sheet (ingest_def.read_excel_columns), without and with sidecar
+ - compact : used columns, shared text categories and downcast numbers of the bands and pull-down read
+   (the next stages run on the compact datasets, as in the app)
+ - keep_myc / cut_MW : contaminants' removal / MW cut-offs, band by band
+ - filter_bands : both, all the bands at once (what the app runs)
+ - overlap : presence matrix and every common / specific table
+ - pulldown : pull-down treatment, cross with the clean bands
+ - volcano : both volcano plots of the app
+ - write : excel results of the bands (skipped above WRITE_LIMIT rows)
+ - with --imports, cold start : import time of the modules the app window needs, of the analysis modules
+   (imported after the window is shown) and of the command line, each in a new interpreter (see IMPORTS)
+
+The results (best and median of the repeats, in seconds) are saved as json, with the versions used.
+--compare prints the ratio to a previous results file, and marks the stages slower than --tolerance.
+"""
+
+import argparse
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+import matplotlib
+matplotlib.use('Agg') # no display
+
+import numpy as np
+import pandas as pd
+
+import ingest_def
+import pipeline_def
+import profiling_def
+import synthetic_def
+
+
+STAGES = ['ingest', 'compact', 'keep_myc', 'cut_MW', 'filter_bands', 'overlap', 'pulldown', 'volcano', 'write']
+ROWS = [1000, 10000, 100000]
+BANDS = [2, 10, 50]
+WRITE_LIMIT = 1000000 # rows of all the bands, above it the excel writing is not timed
+# cold start, see profiling_def.import_times
+IMPORTS = {'app window' : 'tkinter, app_def, profiling_def', 'analysis modules' : 'auto_prot_def',
+           'command line' : 'proteocross'}
+
+
+
+def timed(function, repeat):
+    # seconds of each call
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function()
+        times.append(time.perf_counter() - start)
+    return(times)
+
+
+
+def bench_ingest(rows, repeat, folder, seed=0, proteome=None):
+    # one excel file of rows identifications, read without cache then from its sidecar
+    # proteome : options of synthetic_def.proteome ({'species', 'mw_median', 'mw_sigma'})
+    proteins = synthetic_def.proteome(2*rows, seed=seed, **(proteome or {}))
+    path = synthetic_def.write_protein_sets(synthetic_def.protein_sets(rows, proteins, seed=seed),
+                                            os.path.join(folder, 'band '+str(rows)+'.xlsx'))
+    cache_dir = os.path.join(folder, ingest_def.CACHE_FOLDER)
+    ingest_def.read_protein_sets(path, cache_dir=cache_dir) # sidecar saved once
+    return({'ingest' : timed(lambda: ingest_def.read_excel_columns(path), repeat),
+            'ingest (sidecar)' : timed(lambda: ingest_def.read_protein_sets(path, cache_dir=cache_dir), repeat)})
+
+
+
+def bench_bands(rows, n_bands, pulldown_rows, stages, repeat, folder, seed=0, proteome=None):
+    # every stage after the reading, on n_bands synthetic bands of rows identifications
+    # proteome : options of synthetic_def.proteome ({'species', 'mw_median', 'mw_sigma'})
+    proteins = synthetic_def.proteome(2*max(rows, pulldown_rows), seed=seed, **(proteome or {}))
+    bands_dict = synthetic_def.bands_dict(n_bands, rows, proteins, seed=seed)
+    whole_pulld = synthetic_def.pulldown(pulldown_rows, proteins, seed=seed)
+    times = {}
+
+    if 'compact' in stages:
+        times['compact'] = timed(lambda: pipeline_def.compact_datasets(bands_dict, whole_pulld), repeat)
+    bands_dict, whole_pulld = pipeline_def.compact_datasets(bands_dict, whole_pulld)
+    clean_df, keep_prints = pipeline_def.filter_bands(bands_dict)
+
+    if 'keep_myc' in stages:
+        times['keep_myc'] = timed(lambda: [pipeline_def.keep_myc(v[0]) for v in bands_dict.values()], repeat)
+
+    if 'cut_MW' in stages:
+        times['cut_MW'] = timed(lambda: [pipeline_def.cut_MW(v[0], v[1], v[2]) for v in bands_dict.values()], repeat)
+
+    if 'filter_bands' in stages:
+        times['filter_bands'] = timed(lambda: pipeline_def.filter_bands(bands_dict), repeat)
+
+    if 'overlap' in stages:
+        times['overlap'] = timed(lambda: dict(pipeline_def.overlap_bands(clean_df)[0]), repeat)
+
+    if 'pulldown' in stages or 'volcano' in stages:
+        run = lambda: pipeline_def.process_pulldown(whole_pulld.copy(), clean_df)
+        if 'pulldown' in stages:
+            times['pulldown'] = timed(run, repeat)
+        pulld_bands, pulld_access, pulldown_res, txt = run()
+
+    if 'volcano' in stages:
+        pulld_top15 = pipeline_def.get_df_data_to_display(pulld_bands, pulld_access)[1]
+        path_pd = os.path.join(folder, 'pulldown')
+        times['volcano'] = timed(lambda: pipeline_def.plot_volcanoes(pulldown_res, pulld_access, pulld_bands, pulld_top15,
+                                                                     path_pd), repeat)
+
+    if 'write' in stages and rows*n_bands <= WRITE_LIMIT:
+        common_results = dict(pipeline_def.overlap_bands(clean_df)[0])
+        saving_path = os.path.join(folder, 'Bands analysis results.xlsx')
+        times['write'] = timed(lambda: pipeline_def.save_bands_results(saving_path, clean_df, common_results), repeat)
+
+    return(times)
+
+
+
+def result(stage, rows, n_bands, pulldown_rows, times):
+    return({'stage' : stage, 'rows' : rows, 'bands' : n_bands, 'pulldown_rows' : pulldown_rows,
+            'times' : [round(t, 6) for t in times], 'best' : round(min(times), 6),
+            'median' : round(statistics.median(times), 6)})
+
+
+
+def versions():
+    # what the results depend on
+    try:
+        commit = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=os.path.dirname(os.path.abspath(__file__)),
+                                capture_output=True, text=True, timeout=10).stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        commit = None
+    return({'date' : datetime.now().isoformat(timespec='seconds'), 'commit' : commit,
+            'python' : platform.python_version(), 'numpy' : np.__version__, 'pandas' : pd.__version__,
+            'matplotlib' : matplotlib.__version__, 'platform' : platform.platform(), 'cpu_count' : os.cpu_count()})
+
+
+
+def run(rows=ROWS, bands=BANDS, stages=STAGES, repeat=3, pulldown_rows=None, seed=0, log=print, imports=False,
+        species=synthetic_def.SPECIES_MIX, mw_median=synthetic_def.MW_MEDIAN, mw_sigma=synthetic_def.MW_SIGMA):
+    # every stage at every size (and the import times), returns the json-able results
+    # species / mw_median / mw_sigma : synthetic proteome, see synthetic_def.proteome
+    proteome = {'species' : species, 'mw_median' : mw_median, 'mw_sigma' : mw_sigma}
+    results = []
+    if imports:
+        folder = os.path.dirname(os.path.abspath(__file__))
+        for name, times in profiling_def.import_times(IMPORTS, repeat, folder).items():
+            results.append(result('import '+name, 0, 0, 0, times))
+            log(format_result(results[-1]))
+
+    with tempfile.TemporaryDirectory() as folder:
+        for r in rows:
+            if 'ingest' in stages:
+                for stage, times in bench_ingest(r, repeat, folder, seed, proteome).items():
+                    results.append(result(stage, r, 1, 0, times))
+                    log(format_result(results[-1]))
+
+            for b in bands:
+                p = pulldown_rows or r
+                for stage, times in bench_bands(r, b, p, stages, repeat, folder, seed, proteome).items():
+                    results.append(result(stage, r, b, p, times))
+                    log(format_result(results[-1]))
+
+    return({'meta' : dict(versions(), repeat=repeat, seed=seed, **proteome), 'results' : results})
+
+
+
+def format_result(res):
+    size = format(res['rows'], '>8')+' rows'+format(res['bands'], '>4')+' bands' if res['rows'] else ''
+    return(format(res['stage'], '<24')+format(size, '>22')+'   '
+           +format(res['best'], '.4f')+' s (median '+format(res['median'], '.4f')+')')
+
+
+
+def compare(new, old, tolerance=0.2):
+    # ratio new / old of the best times, for the stages and sizes in both files
+    old_best = {(r['stage'], r['rows'], r['bands'], r['pulldown_rows']) : r['best'] for r in old['results']}
+    lines = ['compared to '+str(old['meta'].get('commit'))+' ('+str(old['meta'].get('date'))+') :']
+    slower = 0
+    for r in new['results']:
+        key = (r['stage'], r['rows'], r['bands'], r['pulldown_rows'])
+        if key not in old_best or not old_best[key]:
+            continue
+        ratio = r['best'] / old_best[key]
+        flag = ''
+        if ratio > 1 + tolerance:
+            flag = '   <- slower'
+            slower += 1
+        lines.append(format_result(r)+'   x'+format(ratio, '.2f')+flag)
+    return('\n'.join(lines), slower)
+
+
+
+def species_mix(values):
+    # --species MYCTU=0.55 HUMAN=0.45 -> {'MYCTU' : 0.55, 'HUMAN' : 0.45}
+    mix = {}
+    for value in values:
+        name, sep, share = value.partition('=')
+        try:
+            mix[name] = float(share)
+        except ValueError:
+            raise argparse.ArgumentTypeError('--species : SPECIES=share expected, not "'+value+'"')
+        if not sep or not name or mix[name] < 0:
+            raise argparse.ArgumentTypeError('--species : SPECIES=share expected, not "'+value+'"')
+    if not sum(mix.values()):
+        raise argparse.ArgumentTypeError('--species : the shares add up to 0')
+    return(mix)
+
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='benchmark', description='Time every stage of the pipeline on synthetic data.')
+    parser.add_argument('--rows', type=int, nargs='+', default=ROWS, help='identifications per band')
+    parser.add_argument('--bands', type=int, nargs='+', default=BANDS, help='number of bands')
+    parser.add_argument('--pulldown-rows', type=int, help='identifications in the pull-down (default : as --rows)')
+    parser.add_argument('--stages', nargs='+', choices=STAGES, default=STAGES)
+    parser.add_argument('--repeat', type=int, default=3, help='runs of each stage, best and median are kept')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--species', nargs='+', metavar='SPECIES=share',
+                        help='species suffixes of the synthetic proteome and their share (default : '
+                             +' '.join(s+'='+format(v, 'g') for s, v in synthetic_def.SPECIES_MIX.items())+')')
+    parser.add_argument('--mw-median', type=float, default=synthetic_def.MW_MEDIAN, help='median MW of the proteome (Dalton)')
+    parser.add_argument('--mw-sigma', type=float, default=synthetic_def.MW_SIGMA, help='sigma of log(MW) of the proteome')
+    parser.add_argument('--out', default='benchmark_results.json', help='json results file')
+    parser.add_argument('--compare', help='previous json results file')
+    parser.add_argument('--tolerance', type=float, default=0.2, help='with --compare, slower above 1 + tolerance')
+    parser.add_argument('--imports', action='store_true', help='also time the cold import of the modules (start of the app)')
+    args = parser.parse_args(argv)
+    try:
+        species = species_mix(args.species) if args.species else synthetic_def.SPECIES_MIX
+    except argparse.ArgumentTypeError as e:
+        parser.error(str(e))
+
+    results = run(args.rows, args.bands, args.stages, args.repeat, args.pulldown_rows, args.seed, imports=args.imports,
+                  species=species, mw_median=args.mw_median, mw_sigma=args.mw_sigma)
+    with open(args.out, 'w', encoding='utf-8') as f:
+        json.dump(results, f, indent=1)
+    print('Results saved in '+args.out)
+
+    if args.compare:
+        with open(args.compare, encoding='utf-8') as f:
+            txt, slower = compare(results, json.load(f), args.tolerance)
+        print(txt)
+        return(1 if slower else 0)
+    return(0)
+
+
+
+if __name__ == '__main__':
+    sys.exit(main())
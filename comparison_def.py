@@ -0,0 +1,298 @@
+"""
+Comparison of several pull-downs (purification experiments) and the bands : which proteins are enriched where ?
+
+-> every pull-down is treated as in pipeline_def.process_pulldown (contaminants removed, log transforms, q-values)
+-> all the pull-downs and clean bands are placed in one matrix indexed by accession : ratio, p-value (and q-value)
+   of each pull-down, whether the protein is enriched in it, and its presence in each band
+   (accessions matched through their canonical IDs, see accession_def)
+-> UpSet-style summary : the proteins enriched in exactly the same pull-downs form an intersection,
+   each protein is counted once, in the intersection of all the pull-downs where it is enriched
+-> the tables are saved with output_def (one sheet each), the summary also as an UpSet plot
+
+No pyplot : the plot can be drawn from any thread.
+"""
+
+import os
+
+import numpy as np
+import pandas as pd
+from matplotlib.figure import Figure
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+
+import accession_def
+import ingest_def
+import output_def
+import pipeline_def
+import rules_def
+import stage_cache_def
+
+
+MAX_PULLDOWNS = 62 # an intersection is coded as the bits of an int64
+UPSET_TOP = 30 # largest intersections drawn
+UPSET_COLOR = '#1F618D'
+
+
+
+def pulldown_names(pulldowns):
+    # names of the pull-downs of a manifest : given name, else P1, P2, ... in the given order
+    return([pulld.get('name') or 'P'+str(i+1) for i, pulld in enumerate(pulldowns)])
+
+
+
+def load_pulldowns(pulldowns, cache=True):
+    # read the pull-downs of a manifest : [{'file' : path, 'name' : optional}, ...], returns { name : dataframe }
+    loaded = {}
+    for name, pulld in zip(pulldown_names(pulldowns), pulldowns):
+        df = ingest_def.read_protein_sets(pulld['file'], columns=ingest_def.PULLDOWN_COLUMNS, cache=cache)
+        df.name = name
+        loaded[name] = df
+    return(loaded)
+
+
+
+def treat_pulldown(whole_pulld, rules=None, min_ratio=pipeline_def.MIN_RATIO, max_pvalue=pipeline_def.MAX_PVALUE,
+                   correction=None):
+    '''
+    contaminants' removal, log transforms (and q-values) of one pull-down, as in pipeline_def.process_pulldown,
+    with an 'enriched' column (see pipeline_def.significant_mask)
+    '''
+    pulldown_res, txt = pipeline_def.keep_myc(whole_pulld, None, rules)
+    pulldown_res = pipeline_def.volcano_transform(pulldown_res)[0]
+    if correction == 'bh':
+        pulldown_res = pipeline_def.add_qvalues(pulldown_res)
+    pulldown_res = pulldown_res.assign(enriched=pipeline_def.significant_mask(pulldown_res, min_ratio, max_pvalue,
+                                                                              correction))
+    return(pulldown_res, txt)
+
+
+
+def experiment_matrix(treated, clean_df=(), correction=None, match=accession_def.DEFAULT_MATCH):
+    '''
+    one row per protein (canonical ID, labelled by its first accession, see accession_def.AccessionIndex)
+    of any pull-down or band, built in one pass :
+    'ratio <name>', 'p-value <name>' (and 'q-value <name>' with correction='bh') and 'enriched <name>'
+    of each treated pull-down (see treat_pulldown), missing (not enriched) where the protein was not identified,
+    then 'in <band>' (True / False) for each clean band
+    a protein identified several times in a pull-down (isoforms with match='protein') is enriched if one of its rows is,
+    the values of its first enriched row (else of its first row) are kept
+    '''
+    names = list(treated)
+    frames = list(treated.values()) + list(clean_df)
+    sizes = [len(df) for df in frames]
+    starts = np.cumsum([0] + sizes)
+    source = np.repeat(np.arange(len(frames)), sizes)
+    enriched = np.zeros(starts[-1], dtype=bool)
+    for k, df in enumerate(treated.values()):
+        enriched[starts[k]:starts[k+1]] = df['enriched'].to_numpy(dtype=bool)
+
+    index = accession_def.AccessionIndex(frames, match)
+    acc_codes = np.concatenate(index.codes) if frames else np.array([], dtype=int)
+    found = np.flatnonzero(acc_codes >= 0) # missing accessions are not proteins
+    # kept row of each (protein, pull-down or band) : enriched rows first, then in the file order
+    pair = acc_codes[found].astype(np.int64) * len(frames) + source[found]
+    order = found[np.lexsort((found, ~enriched[found], pair))]
+    pair = acc_codes[order].astype(np.int64) * len(frames) + source[order]
+    rows = order[np.flatnonzero(np.r_[True, pair[1:] != pair[:-1]])]
+
+    values = [('ratio', 'ratio_g1_vs_g2'), ('p-value', 't_test_g1_vs_g2')]
+    if correction == 'bh':
+        values.append(('q-value', 'q_value_BH'))
+
+    columns = {}
+    for k, df in enumerate(frames):
+        at = rows[source[rows] == k]
+        if k < len(names):
+            for label, column in values:
+                col = np.full(len(index), np.nan)
+                col[acc_codes[at]] = df[column].to_numpy(dtype=float)[at - starts[k]]
+                columns[label+' '+names[k]] = col
+            col = np.zeros(len(index), dtype=bool)
+            col[acc_codes[at]] = enriched[at]
+            columns['enriched '+names[k]] = col
+        else:
+            present = np.zeros(len(index), dtype=bool)
+            present[acc_codes[at]] = True
+            columns['in '+df.name] = present
+
+    return(pd.DataFrame(columns, index=pd.Index(index.labels, name='accession')))
+
+
+
+def columns_of(matrix, prefix, names):
+    # 'prefix <name>' columns of the matrix as an accession x name dataframe
+    table = matrix[[prefix+' '+str(n) for n in names]]
+    table.columns = list(names)
+    return(table)
+
+
+
+def intersections(membership, presence=None):
+    '''
+    UpSet-style summary of a boolean accession x set matrix (enrichment in the pull-downs)
+    one row per combination of sets holding accessions, each accession counted only in the combination
+    of all its sets (exclusive intersections), the accessions in no set are not counted
+    columns : one True / False per set, 'degree' (number of sets), 'size' (accessions), and with presence
+    (accession x band, same index) the number of these accessions found in each band ('in <band>')
+    sorted by decreasing size, then degree
+    '''
+    sets = list(membership.columns)
+    if len(sets) > MAX_PULLDOWNS:
+        raise ValueError('At most '+str(MAX_PULLDOWNS)+' pull-downs can be compared at once.')
+    M = membership.to_numpy(dtype=bool)
+
+    bits = M.astype(np.int64) @ (np.int64(1) << np.arange(len(sets), dtype=np.int64))
+    inside = bits > 0
+    combos, inverse, sizes = np.unique(bits[inside], return_inverse=True, return_counts=True)
+
+    member = ((combos[:, None] >> np.arange(len(sets), dtype=np.int64)) & 1).astype(bool)
+    table = pd.DataFrame(member, columns=sets)
+    table['degree'] = member.sum(axis=1)
+    table['size'] = sizes
+
+    if presence is not None:
+        counts = np.zeros((len(combos), presence.shape[1]), dtype=np.int64)
+        np.add.at(counts, inverse.ravel(), presence.to_numpy(dtype=np.int64)[inside])
+        for j, band in enumerate(presence.columns):
+            table['in '+str(band)] = counts[:, j]
+
+    order = np.lexsort((table['degree'].to_numpy(), -table['size'].to_numpy()))
+    return(table.take(order).reset_index(drop=True))
+
+
+
+def combination_name(row, sets):
+    # 'P1 & P3' for an intersection row
+    return(' & '.join(str(s) for s in sets if row[s]))
+
+
+
+def top_by_pulldown(treated, n=pipeline_def.TOP_N, key='ratio'):
+    # the n best enriched proteins of each treated pull-down by key (see pipeline_def.top_n), as displayed
+    enriched = [df.loc[df['enriched'].to_numpy()] for df in treated.values()]
+    if not enriched:
+        return(pd.DataFrame())
+    groups = np.repeat(list(treated), [len(df) for df in enriched])
+    rows = pd.concat(enriched, ignore_index=True)
+    best = pipeline_def.top_n(rows, n, key, group=groups)
+    table = pipeline_def.display_columns(best)
+    table.insert(0, 'Pull-down', groups[best.index.to_numpy()])
+    return(table)
+
+
+
+def compare_pulldowns(pulldowns, clean_df=(), rules=None, min_ratio=pipeline_def.MIN_RATIO,
+                      max_pvalue=pipeline_def.MAX_PVALUE, correction=None, top=pipeline_def.TOP_N, rank='ratio',
+                      match=accession_def.DEFAULT_MATCH):
+    '''
+    pulldowns : { name : pull-down as read }, clean_df : clean bands (optional)
+    min_ratio / max_pvalue / correction : significance in every pull-down, see pipeline_def.significant
+    top / rank : the top best enriched proteins of each pull-down by rank, see pipeline_def.top_n
+    match : how accessions are matched between the pull-downs and the bands, see accession_def
+    returns a dict :
+    'matrix' : see experiment_matrix, 'enriched' : accession x pull-down,
+    'intersections' : see intersections (with the bands),
+    'pairs' : proteins enriched in both, pull-down x pull-down (diagonal : enriched in the pull-down),
+    'top' : see top_by_pulldown,
+    'txt' : printed summary
+    '''
+    if rules is None:
+        rules = rules_def.get_rules()
+    names = list(pulldowns)
+
+    treated = {}
+    txt = '\n Pull-downs comparison : '
+    for name, df in pulldowns.items():
+        df.name = name
+        treated[name], keep_print = treat_pulldown(df, rules, min_ratio, max_pvalue, correction)
+        txt += '\n'+keep_print
+
+    matrix = experiment_matrix(treated, clean_df, correction, match)
+    enriched = columns_of(matrix, 'enriched', names)
+    table = intersections(enriched, columns_of(matrix, 'in', [df.name for df in clean_df]) if len(clean_df) else None)
+    pairs = pipeline_def.pair_counts(enriched)
+
+    in_any = int(enriched.any(axis=1).sum())
+    in_all = int(enriched.all(axis=1).sum()) if names else 0
+    txt += '\n\n Proteins with '+pipeline_def.significance_text(min_ratio, max_pvalue, correction)+' :\n'
+    for name in names:
+        txt += str(int(pairs.loc[name, name]))+' enriched in '+name+'\n'
+    txt += str(in_any)+' enriched in at least one pull-down, '+str(in_all)+' in all of them.\n'
+    for _, row in table.head(5).iterrows():
+        txt += str(row['size'])+' enriched only in '+combination_name(row, names)+'\n'
+
+    return({'matrix' : matrix, 'enriched' : enriched, 'intersections' : table, 'pairs' : pairs,
+            'top' : top_by_pulldown(treated, top, rank), 'txt' : txt})
+
+
+
+def save_comparison(saving_path, comparison, fmt='xlsx', workers=1):
+    # the matrix, the intersections, the pairs and the top proteins in one results file
+    # (fmt / workers : see output_def.write_sheets)
+    sheets = [('matrix', comparison['matrix'].reset_index()), ('intersections', comparison['intersections']),
+              ('pairs', comparison['pairs'].rename_axis('pull-down').reset_index()), ('top', comparison['top'])]
+    return(output_def.write_sheets(saving_path, sheets, fmt, workers))
+
+
+
+def upset_plot(table, sets, saving_path, top=UPSET_TOP, figsize=(8, 5), dpi=100):
+    '''
+    UpSet plot of an intersections table (see intersections) : the sizes of the top largest intersections
+    as bars, over the dots of the pull-downs in each intersection, saved as png
+    '''
+    table = table.head(top)
+    fig = Figure(figsize=figsize, dpi=dpi)
+    FigureCanvasAgg(fig)
+    bars, dots = fig.subplots(2, 1, sharex=True, gridspec_kw={'height_ratios' : (2, 1)})
+    x = np.arange(len(table))
+
+    bars.bar(x, table['size'], color=UPSET_COLOR)
+    for xi, size in zip(x, table['size']):
+        bars.annotate(str(size), (xi, size), ha='center', va='bottom', fontsize=7)
+    bars.set_ylabel('Enriched proteins')
+    bars.spines[['top', 'right']].set_visible(False)
+
+    member = table[list(sets)].to_numpy(dtype=bool)
+    y = np.arange(len(sets))
+    X, Y = np.meshgrid(x, y, indexing='ij')
+    dots.scatter(X[~member], Y[~member], color='#D5D8DC', s=30)
+    dots.scatter(X[member], Y[member], color=UPSET_COLOR, s=30, zorder=2)
+    for xi, row in zip(x, member):
+        if row.sum() > 1:
+            dots.plot([xi, xi], [y[row].min(), y[row].max()], color=UPSET_COLOR, linewidth=1.5)
+    dots.set_yticks(y, [str(s) for s in sets])
+    dots.set_xticks([])
+    dots.set_ylim(len(sets) - 0.5, -0.5) # first pull-down on top
+    for side in ('top', 'right', 'bottom', 'left'):
+        dots.spines[side].set_visible(False)
+
+    fig.suptitle('Proteins enriched in the same pull-downs')
+    fig.savefig(saving_path)
+    return(saving_path)
+
+
+
+def run_comparison(pulldowns, clean_df, saving_dir, rules=None, min_ratio=pipeline_def.MIN_RATIO,
+                   max_pvalue=pipeline_def.MAX_PVALUE, correction=None, fmt='xlsx', workers=1, stages=None,
+                   top=pipeline_def.TOP_N, rank='ratio', match=accession_def.DEFAULT_MATCH):
+    '''
+    compare_pulldowns, then 'Pull-downs comparison.xlsx' (fmt : see output_def.write_sheets) and its UpSet plot
+    'Pull-downs comparison.png' in saving_dir
+    stages : stage cache (see stage_cache_def), the comparison is loaded if its inputs did not change
+    returns the comparison dict with 'saving_paths'
+    '''
+    if rules is None:
+        rules = rules_def.get_rules()
+    args = (pulldowns, clean_df, rules, min_ratio, max_pvalue, correction, top, rank, match)
+    if stages is None:
+        comparison = compare_pulldowns(*args)
+    else:
+        key = stage_cache_def.data_hash(*pulldowns, *pulldowns.values(), pipeline_def.clean_bands_hash(clean_df),
+                                        stage_cache_def.rules_key(rules), min_ratio, max_pvalue, correction, top,
+                                        pipeline_def.rank_label(rank), match)
+        comparison = stages.cached('compare', key, compare_pulldowns, *args)[0]
+
+    saving_paths = save_comparison(os.path.join(saving_dir, 'Pull-downs comparison.xlsx'), comparison, fmt, workers)
+    if len(comparison['intersections']):
+        saving_paths.append(upset_plot(comparison['intersections'], list(pulldowns),
+                                       os.path.join(saving_dir, 'Pull-downs comparison.png')))
+    return(dict(comparison, saving_paths=saving_paths))
@@ -0,0 +1,310 @@
+"""
+Reading of the "Protein sets" sheets exported by the identification software.
+
+-> columns are selected by header name, not by Excel letters
+-> the fastest available Excel engine is used (calamine if installed, else openpyxl)
+-> every sheet read is cached in a sidecar file, named after the hash of the Excel file's content :
+   the next reading of an unchanged file only loads the sidecar.
+   Parquet if pyarrow is installed, else a pandas pickle.
+   Sidecars are saved in a '.proteocross_cache' folder next to the data (or in cache_dir).
+-> csv / tsv exports (also compressed) are read as well, whole or chunk by chunk (see read_text_chunks) :
+   very large exports are filtered while they are read (see pipeline_def.stream_filter_band)
+-> once read, the datasets are made compact (see compact) : repeated text as categories shared by all the
+   datasets, numbers in the smallest type holding the same values (every column is kept, they are all written)
+"""
+
+import hashlib
+import importlib.util
+import os
+import shutil
+
+import numpy as np
+import pandas as pd
+
+
+SHEET = 'Protein sets'
+CACHE_FOLDER = '.proteocross_cache'
+
+# columns used by the pull-down treatment, the result files and the display
+PULLDOWN_COLUMNS = ['accession', 'gene_name', 'description', 'protein_set_score', 'coverage', 'MW',
+                    'ratio_g1_vs_g2', 't-test_g1_vs_g2']
+# text repeated between rows and datasets, stored once as categories
+CATEGORY_COLUMNS = ['accession', 'gene_name', 'description']
+
+# text exports : extension -> separator (None : guessed from the header), compressed files end with .gz, .bz2 ...
+TEXT_EXTENSIONS = {'.csv' : ',', '.tsv' : '\t', '.tab' : '\t', '.txt' : None}
+COMPRESSIONS = ('.gz', '.bz2', '.xz', '.zip', '.zst')
+CHUNK_ROWS = 100000 # rows of a chunk read at once
+
+
+
+def excel_engine():
+    # calamine (rust) parses xlsx several times faster than openpyxl, used when installed
+    if importlib.util.find_spec('python_calamine') is not None:
+        return('calamine')
+    return(None)
+
+
+def cache_format():
+    if importlib.util.find_spec('pyarrow') is not None:
+        return('parquet')
+    return('pkl')
+
+
+
+def file_hash(path, chunk_size=1 << 20):
+    # sha1 of the file's content, read by chunks
+    h = hashlib.sha1()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            h.update(chunk)
+    return(h.hexdigest())
+
+
+
+def sidecar_path(path, sheet_name=SHEET, columns=None, cache_dir=None, content_hash=None):
+    # sidecar file of a sheet : depends on the content of the file, the sheet and the selected columns
+    if content_hash is None:
+        content_hash = file_hash(path)
+    key = hashlib.sha1((sheet_name+'|'+'|'.join(columns or [])).encode('utf-8')).hexdigest()[:8]
+
+    folder = cache_dir or os.path.join(os.path.dirname(os.path.abspath(path)), CACHE_FOLDER)
+    stem = os.path.splitext(os.path.basename(path))[0]
+    return(os.path.join(folder, stem+'.'+content_hash[:16]+'.'+key+'.'+cache_format()))
+
+
+
+def _load_sidecar(sidecar):
+    if sidecar.endswith('.parquet'):
+        return(pd.read_parquet(sidecar))
+    return(pd.read_pickle(sidecar))
+
+
+def _save_sidecar(df, sidecar):
+    # the cache is only a speed-up : a sidecar that cannot be written is skipped
+    try:
+        os.makedirs(os.path.dirname(sidecar), exist_ok=True)
+        tmp = sidecar+'.'+str(os.getpid())+'.tmp' # several processes can read the same file
+        if sidecar.endswith('.parquet'):
+            df.to_parquet(tmp, index=False)
+        else:
+            df.to_pickle(tmp)
+        os.replace(tmp, sidecar)
+    except (OSError, ValueError, TypeError, ImportError):
+        pass
+
+
+
+def read_excel_columns(path, sheet_name=SHEET, columns=None):
+    '''
+    read a sheet, only parsing the given columns (by header name, all if None)
+    raise a ValueError naming the missing columns
+    '''
+    usecols = None
+    if columns is not None:
+        wanted = set(columns)
+        usecols = lambda header: header in wanted
+
+    df = pd.read_excel(path, sheet_name=sheet_name, usecols=usecols, engine=excel_engine())
+
+    if columns is not None:
+        missing = [c for c in columns if c not in df.columns]
+        if missing:
+            raise ValueError('Missing column.s in '+os.path.basename(path)+' : '+', '.join(missing))
+        df = df[list(columns)]
+    return(df)
+
+
+
+def read_columns(path, sheet_name=SHEET, columns=None):
+    # an excel sheet or a whole text export (see is_text_export), only the given columns
+    if is_text_export(path):
+        return(next(read_text_chunks(path, columns, chunksize=None)))
+    return(read_excel_columns(path, sheet_name, columns))
+
+
+
+def read_protein_sets(path, columns=None, sheet_name=SHEET, cache=True, cache_dir=None):
+    '''
+    read the "Protein sets" sheet of an identification file (or a csv / tsv export, see is_text_export)
+    columns : header names to keep (all if None)
+    cache : load / save the hashed sidecar, see this module's description
+    '''
+    if not cache:
+        return(read_columns(path, sheet_name, columns))
+
+    sidecar = sidecar_path(path, sheet_name, columns, cache_dir)
+    if os.path.exists(sidecar):
+        try:
+            return(_load_sidecar(sidecar))
+        except Exception:
+            pass # unreadable sidecar : read the excel file again
+
+    df = read_columns(path, sheet_name, columns)
+    _save_sidecar(df, sidecar)
+    return(df)
+
+
+
+def remove_folder(folder):
+    # delete a cache folder and everything in it (sub-folders too), return how many files were deleted
+    if not os.path.isdir(folder):
+        return(0)
+    removed = sum(len(files) for _, _, files in os.walk(folder))
+    shutil.rmtree(folder)
+    return(removed)
+
+
+
+def clear_cache(folder):
+    # delete the cache saved next to the data of a folder (sidecars and stage results), return how many files were deleted
+    return(remove_folder(os.path.join(folder, CACHE_FOLDER)))
+
+
+
+######################################## Text exports ########################################
+
+
+def _text_name(path):
+    # file name without its compression extension
+    name = os.path.basename(path).lower()
+    for ext in COMPRESSIONS:
+        if name.endswith(ext):
+            return(name[:-len(ext)])
+    return(name)
+
+
+def is_text_export(path):
+    # csv / tsv export (possibly compressed) rather than an excel file
+    return(os.path.splitext(_text_name(path))[1] in TEXT_EXTENSIONS)
+
+
+def text_separator(path):
+    # separator of a text export : from its extension, else the most frequent of tab, ',' and ';' in its header
+    sep = TEXT_EXTENSIONS.get(os.path.splitext(_text_name(path))[1])
+    if sep is not None:
+        return(sep)
+    if _text_name(path) != os.path.basename(path).lower():
+        return('\t') # compressed : no header sniffing
+    with open(path, encoding='utf-8', errors='replace') as f:
+        header = f.readline()
+    return(max(['\t', ',', ';'], key=header.count))
+
+
+
+def text_header(path, sep=None):
+    # column names of a text export
+    return(list(pd.read_csv(path, sep=sep or text_separator(path), nrows=0).columns))
+
+
+
+def read_text_chunks(path, columns=None, chunksize=CHUNK_ROWS, sep=None):
+    '''
+    dataframes of chunksize rows of a csv / tsv export, in the file order (one dataframe if chunksize is None)
+    columns : header names to keep (all if None, only these are parsed), raise a ValueError naming the missing ones
+    the file is memory-mapped when it is not compressed, only one chunk is in memory at a time
+    '''
+    if sep is None:
+        sep = text_separator(path)
+    header = text_header(path, sep)
+    usecols = None
+    if columns is not None:
+        missing = [c for c in columns if c not in header]
+        if missing:
+            raise ValueError('Missing column.s in '+os.path.basename(path)+' : '+', '.join(missing))
+        usecols = list(columns)
+
+    compressed = _text_name(path) != os.path.basename(path).lower()
+    reader = pd.read_csv(path, sep=sep, usecols=usecols, chunksize=chunksize, memory_map=not compressed)
+    if chunksize is None:
+        reader = [reader]
+    for chunk in reader:
+        yield(chunk if columns is None else chunk[usecols])
+
+
+
+######################################## Compact datasets ########################################
+
+
+def shared_codes(frames, column):
+    '''
+    a text column of all the frames as categoricals sharing the same categories (sorted, so that sorting
+    the column sorts the text), factorized in one pass : {position of the frame : categorical}
+    '''
+    present = [i for i, df in enumerate(frames) if column in df.columns]
+    if not present:
+        return({})
+    values = pd.concat([frames[i][column].astype(object) for i in present], ignore_index=True)
+    try:
+        codes, uniques = pd.factorize(values, sort=True)
+    except TypeError:
+        codes, uniques = pd.factorize(values) # mixed text and numbers : in order of appearance
+    dtype = pd.CategoricalDtype(uniques)
+
+    bounds = np.cumsum([0] + [len(frames[i]) for i in present])
+    return({i : pd.Categorical.from_codes(codes[bounds[k]:bounds[k+1]], dtype=dtype) for k, i in enumerate(present)})
+
+
+
+def downcast(column):
+    # smallest numeric type holding exactly the same values (integers, float32), else unchanged
+    if pd.api.types.is_bool_dtype(column) or not pd.api.types.is_numeric_dtype(column):
+        return(column)
+    if pd.api.types.is_integer_dtype(column):
+        return(pd.to_numeric(column, downcast='integer'))
+    small = column.astype('float32')
+    if np.array_equal(small.to_numpy(dtype=float), column.to_numpy(dtype=float), equal_nan=True):
+        return(small)
+    return(column)
+
+
+
+def compact(frames, columns=None, categories=CATEGORY_COLUMNS):
+    '''
+    compact copies of datasets read together (bands, pull-downs), in the same order, with the same .name
+    -> only columns are kept (the ones present, in this order), or all if None
+    -> categories columns share the same categories in every frame : each text is stored once,
+       frames cut from them or concatenated keep the small codes
+    -> numbers are downcast without changing any value (see downcast)
+    '''
+    frames = list(frames)
+    if columns is not None:
+        frames_kept = []
+        for df in frames:
+            kept = df[[c for c in columns if c in df.columns]]
+            kept.name = getattr(df, 'name', None)
+            frames_kept.append(kept)
+        frames = frames_kept
+    shared = {c : shared_codes(frames, c) for c in categories}
+
+    compact_frames = []
+    for i, df in enumerate(frames):
+        new = {}
+        for c in df.columns:
+            if c in shared:
+                new[c] = shared[c][i]
+            else:
+                new[c] = downcast(df[c])
+        new_df = pd.DataFrame(new, index=df.index)
+        new_df.name = getattr(df, 'name', None)
+        compact_frames.append(new_df)
+    return(compact_frames)
+
+
+
+def memory_mb(frames):
+    # memory used by datasets (text included), in MB, shared categories counted once
+    total = 0
+    seen = set()
+    for df in frames:
+        for c in df.columns:
+            column = df[c]
+            if isinstance(column.dtype, pd.CategoricalDtype):
+                total += column.cat.codes.nbytes
+                categories = column.cat.categories
+                if id(categories) not in seen:
+                    seen.add(id(categories))
+                    total += categories.memory_usage(deep=True)
+            else:
+                total += column.memory_usage(index=False, deep=True)
+    return(round(total / 2**20, 2))
@@ -0,0 +1,106 @@
+"""
+Writing of the result tables (several named tables per result file).
+
+-> 'xlsx' : one workbook, one sheet per table. With xlsxwriter installed, the workbook is streamed
+   row by row in constant memory (much faster than openpyxl for many or large sheets), else
+   pandas' default engine is used.
+-> 'csv' / 'parquet' : one file per table in a folder named after the result file,
+   written in parallel (parquet needs pyarrow).
+-> 'long' : a single tidy csv file, all the tables stacked with a first 'sheet' column.
+"""
+
+import importlib.util
+import os
+import re
+from concurrent.futures import ThreadPoolExecutor
+
+import pandas as pd
+
+
+FORMATS = ('xlsx', 'csv', 'parquet', 'long')
+SHEET_COLUMN = 'sheet'
+
+
+
+def xlsx_engine():
+    # xlsxwriter streams the rows of a workbook (constant memory), used when installed
+    if importlib.util.find_spec('xlsxwriter') is not None:
+        return('xlsxwriter')
+    return(None)
+
+
+
+def file_name(sheet_name):
+    # a sheet name as a file name ('ratio>2 p<=0.05' -> 'ratio_2 p_=0.05')
+    return(re.sub(r'[<>:"/\\|?*]', '_', sheet_name))
+
+
+
+def _rows(df):
+    # rows of a table as tuples, missing values as None (empty cells)
+    values = df.astype(object).where(df.notna(), None)
+    return(values.itertuples(index=False, name=None))
+
+
+
+def write_xlsx(saving_path, sheets):
+    # one sheet per (name, dataframe), in this order
+    if xlsx_engine() is None:
+        with pd.ExcelWriter(saving_path) as writer:
+            for name, df in sheets:
+                df.to_excel(writer, sheet_name=name, index=False)
+        return
+
+    # pandas writes the cells column by column : constant memory needs the rows written in order
+    import xlsxwriter
+    workbook = xlsxwriter.Workbook(saving_path, {'constant_memory' : True, 'strings_to_numbers' : False,
+                                                 'strings_to_formulas' : False, 'strings_to_urls' : False})
+    bold = workbook.add_format({'bold' : True, 'border' : 1, 'align' : 'center'})
+    for name, df in sheets:
+        worksheet = workbook.add_worksheet(name)
+        worksheet.write_row(0, 0, [str(c) for c in df.columns], bold)
+        for i, row in enumerate(_rows(df), start=1):
+            worksheet.write_row(i, 0, row)
+    workbook.close()
+
+
+
+def _write_table(path, df, fmt):
+    if fmt == 'parquet':
+        df.to_parquet(path, index=False)
+    else:
+        df.to_csv(path, index=False)
+    return(path)
+
+
+
+def write_sheets(saving_path, sheets, fmt='xlsx', workers=1):
+    '''
+    write named tables in the format fmt (see FORMATS)
+    saving_path : path of the xlsx file, the other formats are named after it
+                  ('Top 15 Ratio.xlsx' -> 'Top 15 Ratio/<sheet>.csv' or 'Top 15 Ratio.csv' in long format)
+    sheets : [(name, dataframe)] or a dict, workers : files written at the same time (csv, parquet)
+    returns the written paths
+    '''
+    if fmt not in FORMATS:
+        raise ValueError('unknown output format '+repr(fmt)+', expected one of '+', '.join(FORMATS))
+    if fmt == 'parquet' and not any(importlib.util.find_spec(m) for m in ('pyarrow', 'fastparquet')):
+        raise ValueError('parquet output needs pyarrow (pip install pyarrow)')
+    sheets = list(sheets.items()) if isinstance(sheets, dict) else list(sheets)
+    stem = os.path.splitext(saving_path)[0]
+
+    if fmt == 'xlsx':
+        write_xlsx(saving_path, sheets)
+        return([saving_path])
+
+    if fmt == 'long':
+        tables = [df.assign(**{SHEET_COLUMN : name}) for name, df in sheets]
+        long_df = pd.concat(tables, ignore_index=True) if tables else pd.DataFrame(columns=[SHEET_COLUMN])
+        long_df = long_df[[SHEET_COLUMN] + [c for c in long_df.columns if c != SHEET_COLUMN]]
+        long_df.to_csv(stem+'.csv', index=False)
+        return([stem+'.csv'])
+
+    os.makedirs(stem, exist_ok=True)
+    paths = [os.path.join(stem, file_name(name)+'.'+fmt) for name, _ in sheets]
+    with ThreadPoolExecutor(max_workers=max(1, workers or os.cpu_count() or 1)) as pool:
+        return(list(pool.map(_write_table, paths, [df for _, df in sheets], [fmt]*len(sheets))))
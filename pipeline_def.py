@@ -0,0 +1,1267 @@
+"""
+Computation of the proteomics cross-results, without any display.
+
+Used by the Tkinter app (auto_prot_def.py / proteo_app.py) and by the command line (proteocross.py) :
+-> contaminants removal and molecular-weight cut offs of the bands
+-> comparison between bands (presence matrix, common and specific proteins), accessions matched through
+   their canonical IDs (see accession_def)
+-> pull-down treatment and volcano plots
+-> excel / png results
+
+Nothing here imports tkinter, so the whole pipeline can be scripted, run on a compute node or profiled.
+"""
+
+import contextlib
+import itertools
+import os
+from collections.abc import Mapping
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+import accession_def
+import ingest_def
+import output_def
+import rules_def
+import stage_cache_def
+import volcano_def
+
+
+
+######################################## Bands treatments functions ########################################
+
+
+def classify_accessions(accessions, rules=None):
+    # label every accession in one pass, see rules_def for the labels
+    # default rule set ('myc') : HUMAN first, then MOUSE, then MYC, anything else is 'other'
+    if rules is None:
+        rules = rules_def.get_rules()
+    return(rules_def.classify(accessions, rules))
+
+
+
+def keep_summary(name, nbgenes, target, rules):
+    # printed result of the contaminants' removal
+    keep_print = ''
+    keep_print=str("On "+str(nbgenes)+" proteins identified in "+name+", there are "+str(nbgenes-target)+" from contaminants and "+str(target)+" from "+rules['target']+".")
+    return(keep_print)
+
+
+
+def keep_myc(df, right_frame=None, rules=None):
+    # contaminants' removal
+    # every row is labelled at once, then the contaminants are dropped with a single mask
+    # (duplicated accessions are each counted and kept / dropped on their own)
+    # rules : compiled rule set (rules_def.get_rules), default keeps the mycobacterial proteins
+    # right_frame is not used, kept for the GUI's calls
+    if rules is None:
+        rules = rules_def.get_rules()
+
+    name=df.name
+    nbgenes=len(df)
+
+    labels = classify_accessions(df['accession'], rules)
+    keep = labels == rules_def.TARGET
+    target = int(np.count_nonzero(keep))
+
+    df = df.loc[keep]
+
+    keep_print = keep_summary(name, nbgenes, target, rules)
+    
+    return(df, keep_print)
+
+
+
+def detect_mw_unit(mw):
+    # 'kDa' if the molecular weights look like kilo-Daltons (no protein is lighter than 1000 Da), else 'Da'
+    mw = pd.to_numeric(pd.Series(mw), errors='coerce')
+    if mw.notna().any() and mw.median() < 1000:
+        return('kDa')
+    return('Da')
+
+
+
+def mw_mask(mw, MWmin=None, MWmax=None, tolerance=0, unit=None):
+    '''
+    boolean mask of the molecular weights inside [MWmin - tolerance, MWmax + tolerance]
+    cut-offs and tolerance are in Dalton, None for an open bound
+    MWmin / MWmax can also be arrays (one bound per row)
+    unit of the MW column : 'Da', 'kDa' or None to detect it
+    missing molecular weights are kept, as they were before
+    '''
+    mw = pd.to_numeric(pd.Series(mw), errors='coerce').to_numpy(dtype=float)
+    if unit is None:
+        unit = detect_mw_unit(mw)
+    if unit == 'kDa':
+        mw = mw * 1000
+
+    low = np.asarray(-np.inf if MWmin is None else MWmin, dtype=float) - tolerance
+    high = np.asarray(np.inf if MWmax is None else MWmax, dtype=float) + tolerance
+
+    return(~((mw > high) | (mw < low)))
+
+
+
+def cut_MW(df,MWmin,MWmax, right_frame=None, tolerance=0, unit=None):
+    # only keep given molecular weights (in Dalton, None for an open bound)
+    return(df.loc[mw_mask(df['MW'], MWmin, MWmax, tolerance, unit)])
+
+
+
+def filter_bands(bands_dict, rules=None, tolerance=0):
+    '''
+    contaminants' removal and molecular weight cut-offs of all the bands at once
+    the accessions and MW of all the bands are concatenated, labelled and MW-filtered with one mask,
+    each band is then cut from its own dataframe (its columns and types unchanged)
+    returns the list of clean dataframes (named as the bands) and the contaminants' summaries
+    '''
+    if rules is None:
+        rules = rules_def.get_rules()
+    if not bands_dict:
+        return([], [])
+
+    names = list(bands_dict.keys())
+    frames = [v[0] for v in bands_dict.values()]
+    sizes = np.array([len(df) for df in frames])
+    codes = np.repeat(np.arange(len(names)), sizes)
+
+    # only the columns of the mask : the bands may not have the same columns
+    all_bands = pd.concat([df[['accession', 'MW']] for df in frames], ignore_index=True)
+
+    # contaminants
+    keep = np.asarray(classify_accessions(all_bands['accession'], rules) == rules_def.TARGET)
+    targets = np.bincount(codes[keep], minlength=len(names))
+    keep_prints = [keep_summary(name, n, t, rules) for name, n, t in zip(names, sizes, targets)]
+
+    # molecular weights : unit detected by band, one pair of cut-offs per row
+    mw = pd.to_numeric(all_bands['MW'], errors='coerce').to_numpy(dtype=float)
+    scale = np.array([1000 if detect_mw_unit(df['MW']) == 'kDa' else 1 for df in frames])
+    mins = np.array([-np.inf if v[1] is None else v[1] for v in bands_dict.values()], dtype=float)
+    maxs = np.array([np.inf if v[2] is None else v[2] for v in bands_dict.values()], dtype=float)
+    keep &= mw_mask(mw * scale[codes], mins[codes], maxs[codes], tolerance, unit='Da')
+
+    # split back : rows of a band are contiguous, in the given order
+    bounds = np.concatenate([[0], np.cumsum(sizes)])
+
+    clean_df = []
+    for i, name in enumerate(names):
+        df = frames[i].loc[keep[bounds[i]:bounds[i+1]]]
+        df.name = name
+        clean_df.append(df)
+
+    return(clean_df, keep_prints)
+
+
+
+def mw_unit_of_chunks(chunks):
+    '''
+    detect_mw_unit of a molecular weights column given by chunks, without keeping it :
+    the median is below 1000 when more than half of the weights are (for an even count with exactly half,
+    the mean of the two middle weights : the largest below 1000 and the smallest above)
+    '''
+    below = valid = 0
+    max_below = -np.inf
+    min_above = np.inf
+    for mw in chunks:
+        mw = pd.to_numeric(pd.Series(mw), errors='coerce').to_numpy(dtype=float)
+        mw = mw[~np.isnan(mw)]
+        low = mw < 1000
+        below += int(low.sum())
+        valid += len(mw)
+        if low.any():
+            max_below = max(max_below, mw[low].max())
+        if not low.all():
+            min_above = min(min_above, mw[~low].min())
+
+    if 2*below > valid or (valid and 2*below == valid and (max_below + min_above)/2 < 1000):
+        return('kDa')
+    return('Da')
+
+
+
+def stream_filter_band(path, name, MWmin=None, MWmax=None, rules=None, tolerance=0, unit=None,
+                       chunksize=ingest_def.CHUNK_ROWS):
+    '''
+    filter_bands of one band exported as csv / tsv (see ingest_def.read_text_chunks), read chunk by chunk :
+    each chunk is labelled and MW-filtered, only its surviving rows are kept (memory : one chunk and the clean band)
+    unit of the MW column : 'Da', 'kDa' or None to detect it as filter_bands does (the MW column is read once more)
+    returns the clean dataframe (named name, rows numbered as in the file), the contaminants' summary and the counts
+    {'rows', 'target', 'kept', 'chunks'}
+    '''
+    if rules is None:
+        rules = rules_def.get_rules()
+    header = ingest_def.text_header(path)
+    # every column is kept (they are written in the results), accession and MW are needed (missing : ValueError)
+    columns = header + [c for c in ('accession', 'MW') if c not in header]
+    if unit is None:
+        unit = mw_unit_of_chunks(chunk['MW'] for chunk in ingest_def.read_text_chunks(path, ['MW'], chunksize))
+
+    counts = {'rows' : 0, 'target' : 0, 'kept' : 0, 'chunks' : 0}
+    kept = []
+    for chunk in ingest_def.read_text_chunks(path, columns, chunksize):
+        keep = classify_accessions(chunk['accession'], rules) == rules_def.TARGET
+        counts['target'] += int(keep.sum())
+        keep &= mw_mask(chunk['MW'], MWmin, MWmax, tolerance, unit)
+        counts['rows'] += len(chunk)
+        counts['kept'] += int(keep.sum())
+        counts['chunks'] += 1
+        kept.append(chunk.loc[keep])
+
+    clean = pd.concat(kept) if kept else pd.DataFrame(columns=columns)
+    clean.name = name
+    return(clean, keep_summary(name, counts['rows'], counts['target'], rules), counts)
+
+
+
+def presence_matrix(clean_df, match=accession_def.DEFAULT_MATCH, index=None):
+    '''
+    accession x band presence matrix, built once for all the bands
+    returns a boolean dataframe : index = unique proteins (by canonical ID, see accession_def.AccessionIndex,
+    labelled by their first accession), columns = band names
+    index : the AccessionIndex of the bands, built if None
+    '''
+    if index is None:
+        index = accession_def.AccessionIndex(clean_df, match)
+    return(pd.DataFrame(index.presence(), index=pd.Index(index.labels, name='accession'),
+                        columns=[df.name for df in clean_df]))
+
+
+def pair_counts(presence):
+    # number of accessions shared by each pair of bands (bands x bands), the diagonal is the band size
+    P = presence.to_numpy(dtype=np.int32)
+    return(pd.DataFrame(P.T @ P, index=presence.columns, columns=presence.columns))
+
+
+def shared_accessions(presence, bands):
+    # accessions found in all the given bands (pairwise, 3-way, ... k-way)
+    return(presence.index[presence[list(bands)].all(axis=1).to_numpy()])
+
+
+def accessions_in_at_least(presence, k):
+    # accessions found in at least k bands
+    return(presence.index[presence.sum(axis=1).to_numpy() >= k])
+
+
+def specific_accessions(presence, band):
+    # accessions found in this band and in no other band
+    P = presence.to_numpy()
+    only = presence[band].to_numpy() & (P.sum(axis=1) == 1)
+    return(presence.index[only])
+
+
+def _rows_of(band_codes, acc_mask):
+    # row mask of a band from an accession mask, band_codes = row positions in the presence matrix
+    # (-1 for missing accessions : the appended False)
+    return(np.append(acc_mask, False)[band_codes])
+
+
+
+class OverlapTables(Mapping):
+    '''
+    common and specific proteins between bands, as a read-only dict { 'common Bx By' : df, 'specific Bx' : df }
+    the rows found in several bands are gathered once in a frame sorted by accession and band,
+    each table is cut from it (or from the clean band) only when it is asked for,
+    so memory does not grow with the number of pairs
+    '''
+
+    def __init__(self, clean_df, match=accession_def.DEFAULT_MATCH):
+        self.clean_df = clean_df
+        # position of each row of each band in the presence matrix (canonical ID), coded once for all the bands
+        index = accession_def.AccessionIndex(clean_df, match)
+        self.presence = presence_matrix(clean_df, index=index)
+        self.P = self.presence.to_numpy()
+        self.counts = pair_counts(self.presence).to_numpy()
+        in_bands = self.P.sum(axis=1)
+
+        self.band_codes = index.codes
+        self.in_only_one = in_bands == 1
+
+        # one frame with every row found in more than one band, with its real band name
+        shared = [df.loc[_rows_of(codes, in_bands > 1)] for df, codes in zip(clean_df, self.band_codes)]
+        sizes = [len(df) for df in shared]
+        shared = pd.concat(shared, ignore_index=True) if shared else pd.DataFrame(columns=['accession'])
+        shared = shared.assign(band=np.repeat([df.name for df in clean_df], sizes))
+        band_code = np.repeat(np.arange(len(clean_df)), sizes)
+        acc_code = np.concatenate([codes[_rows_of(codes, in_bands > 1)] for codes in self.band_codes]) if clean_df else np.array([], dtype=int)
+
+        # the rows of a protein together, whatever the way its accession is written in each band
+        order = np.lexsort((band_code, self.presence.index.to_numpy().astype(str)[acc_code]))
+        self.shared = shared.take(order).reset_index(drop=True)
+        self.shared_band = band_code[order]
+        self.shared_acc = acc_code[order]
+
+        # sheets order : 'common Bx By' then the specific sheets of Bx and By the first time they appear
+        self.tables = {}
+        for i,j in itertools.combinations(range(len(clean_df)),2):
+            if self.counts[i,j] :
+                self.tables['common '+clean_df[i].name+' '+clean_df[j].name] = ('common', i, j)
+                for k in (i,j):
+                    self.tables.setdefault('specific '+clean_df[k].name, ('specific', k, k))
+
+    def __getitem__(self, name):
+        kind, i, j = self.tables[name]
+
+        if kind == 'common':
+            # rows of Bx and By whose accession is in both, already sorted by accession then band
+            rows = self.P[self.shared_acc, i] & self.P[self.shared_acc, j]
+            rows &= (self.shared_band == i) | (self.shared_band == j)
+            return(self.shared.loc[rows])
+
+        # proteins of Bx found in no other band
+        prot_only = self.clean_df[i].loc[_rows_of(self.band_codes[i], self.P[:,i] & self.in_only_one)]
+        prot_only.name = name
+        return(prot_only)
+
+    def __iter__(self):
+        return(iter(self.tables))
+
+    def __len__(self):
+        return(len(self.tables))
+
+
+
+def overlap_bands(clean_df, match=accession_def.DEFAULT_MATCH):
+    '''
+    gather common proteins between two bands, from the presence matrix
+    returns the tables (see OverlapTables) and the printed summary
+    'specific Bx' holds the proteins of Bx found in no other band
+    match : how accessions are matched between bands, see accession_def
+    '''
+    common_results = OverlapTables(clean_df, match)
+    txt = 'Protein in common between bands :'
+
+    for i,j in itertools.combinations(range(len(clean_df)),2):
+        k1 = clean_df[i].name
+        k2 = clean_df[j].name
+
+        if common_results.counts[i,j] :
+            txt += "\n There are "+str(common_results.counts[i,j])+" proteins in common between "+k1+" and "+k2+" ."
+            txt += " Results will be saved in a specified excel sheet."
+        else : 
+            txt += "\n There is no protein in common between "+k1+" and "+k2+" ."
+
+    return(common_results, txt)
+
+
+
+######################################## Common functions ########################################
+
+
+def path_to_save(path,new_file_name):
+    # get the last path given, delete the opened file name
+    # add the new file name
+    # return the path to the new file
+    return(os.path.join(os.path.dirname(path), new_file_name))
+
+
+
+def save_bands_results(saving_path, clean_df, common_results, fmt='xlsx', workers=1):
+    # all proteins by band (after filter), then common and specific proteins between bands
+    # fmt / workers : see output_def.write_sheets, returns the written paths
+    sheets = [(df.name, df) for df in clean_df] + list(common_results.items())
+    return(output_def.write_sheets(saving_path, sheets, fmt, workers))
+
+
+
+######################################## Pulldown functions ########################################
+
+
+# values given to the infinite transforms (ratio or t-test of exactly 0) : (lowest, highest)
+LOG2_RATIO_CAPS = (-7.78, 6)
+LOG10_TTEST_CAPS = (-7.78, 6)
+
+
+def volcano_transform(pulldown_res, ratio_caps=LOG2_RATIO_CAPS, ttest_caps=LOG10_TTEST_CAPS):
+    '''
+    log2 ratio and -log10 t-test of the pull-down, in one pass on the numpy columns
+    renames 't-test_g1_vs_g2' as 't_test_g1_vs_g2' and adds 'Ratio_Log2' and 'T_test_Log10',
+    only these two columns are capped, infinite values take the (lowest, highest) caps
+    returns the new dataframe and the accessions with a t-test / a ratio of exactly 0 (arrays)
+    '''
+    pulldown_res = pulldown_res.rename(columns={'t-test_g1_vs_g2':'t_test_g1_vs_g2'})
+    ratio = pulldown_res['ratio_g1_vs_g2'].to_numpy(dtype=float)
+    ttest = pulldown_res['t_test_g1_vs_g2'].to_numpy(dtype=float)
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        ratio_log2 = np.log2(ratio)
+        ttest_log10 = -np.log10(ttest)
+
+    ratio_log2 = np.nan_to_num(ratio_log2, nan=np.nan, neginf=ratio_caps[0], posinf=ratio_caps[1])
+    ttest_log10 = np.nan_to_num(ttest_log10, nan=np.nan, neginf=ttest_caps[0], posinf=ttest_caps[1])
+
+    accessions = pulldown_res['accession'].to_numpy()
+    zero_ttest = accessions[ttest == 0]
+    zero_ratio = accessions[ratio == 0]
+
+    pulldown_res = pulldown_res.assign(Ratio_Log2 = ratio_log2, T_test_Log10 = ttest_log10)
+    return(pulldown_res, zero_ttest, zero_ratio)
+
+
+
+# default significance : p-value <= 0.05 and ratio > 2
+MIN_RATIO = 2
+MAX_PVALUE = 0.05
+# tables of the significant proteins found in a band : 'pull <band>'
+PULL_PREFIX = 'pull '
+
+
+def bh_qvalues(pvalues):
+    # Benjamini-Hochberg q-values of all the p-values at once (missing p-values stay missing)
+    p = np.asarray(pvalues, dtype=float)
+    q = np.full(p.shape, np.nan)
+    tested = np.flatnonzero(~np.isnan(p))
+    if not len(tested):
+        return(q)
+
+    order = tested[np.argsort(p[tested], kind='stable')]
+    ranked = p[order] * len(order) / np.arange(1, len(order)+1)
+    # q of a rank = smallest adjusted value of this rank and the following ones
+    q[order] = np.minimum(np.minimum.accumulate(ranked[::-1])[::-1], 1)
+    return(q)
+
+
+def add_qvalues(pulldown_res):
+    # 'q_value_BH' column, from the t-test of the transformed pull-down (see volcano_transform)
+    return(pulldown_res.assign(q_value_BH = bh_qvalues(pulldown_res['t_test_g1_vs_g2'])))
+
+
+def tested_value(correction=None):
+    # what max_pvalue is compared to : ('q', 'BH q-value') with the 'bh' correction, else ('p', 'p-value')
+    return(('q', 'BH q-value') if correction == 'bh' else ('p', 'p-value'))
+
+
+def significance_text(min_ratio=MIN_RATIO, max_pvalue=MAX_PVALUE, correction=None):
+    # 'a p-value ≤ 0.05 and a ratio > 2'
+    return('a '+tested_value(correction)[1]+' ≤ '+format(max_pvalue, 'g')+' and a ratio > '+format(min_ratio, 'g'))
+
+
+def significance_name(min_ratio=MIN_RATIO, max_pvalue=MAX_PVALUE, correction=None):
+    # short form of significance_text, for sheet names : 'ratio>2 p<=0.05' ('q<=' with the 'bh' correction)
+    return('ratio>'+format(min_ratio, 'g')+' '+tested_value(correction)[0]+'<='+format(max_pvalue, 'g'))
+
+
+def significant_mask(pulldown_res, min_ratio=MIN_RATIO, max_pvalue=MAX_PVALUE, correction=None):
+    # True for the rows of significant (see significant), a numpy array
+    if correction == 'bh':
+        if 'q_value_BH' not in pulldown_res.columns:
+            pulldown_res = add_qvalues(pulldown_res)
+        pvalues = pulldown_res['q_value_BH'].to_numpy(dtype=float)
+    elif correction is None:
+        pvalues = pulldown_res['t_test_g1_vs_g2'].to_numpy(dtype=float)
+    else:
+        raise ValueError('Unknown multiple-testing correction "'+str(correction)+'" (None or "bh").')
+
+    return((pvalues <= max_pvalue) & (pulldown_res['ratio_g1_vs_g2'].to_numpy(dtype=float) > min_ratio))
+
+
+def significant(pulldown_res, min_ratio=MIN_RATIO, max_pvalue=MAX_PVALUE, correction=None):
+    '''
+    proteins of the transformed pull-down with a ratio > min_ratio and a p-value <= max_pvalue
+    correction = 'bh' : the Benjamini-Hochberg q-value is used instead of the p-value
+    (computed if the 'q_value_BH' column is missing, see add_qvalues)
+    '''
+    if correction == 'bh' and 'q_value_BH' not in pulldown_res.columns:
+        pulldown_res = add_qvalues(pulldown_res)
+    keep = significant_mask(pulldown_res, min_ratio, max_pvalue, correction)
+    return(pulldown_res.loc[keep].reset_index(drop=True))
+
+
+def threshold_sweep(pulldown_res, thresholds, correction=None):
+    '''
+    significant proteins of the same transformed pull-down for several thresholds
+    thresholds : [(min_ratio, max_pvalue), ...], returns { (min_ratio, max_pvalue) : dataframe }
+    the transform and the q-values are computed once for the whole sweep
+    '''
+    if correction == 'bh' and 'q_value_BH' not in pulldown_res.columns:
+        pulldown_res = add_qvalues(pulldown_res)
+    return({(r, p) : significant(pulldown_res, r, p, correction) for r, p in thresholds})
+
+
+
+def process_pulldown(whole_pulld, clean_df, rules=None, ratio_caps=LOG2_RATIO_CAPS, ttest_caps=LOG10_TTEST_CAPS,
+                     min_ratio=MIN_RATIO, max_pvalue=MAX_PVALUE, correction=None, match=accession_def.DEFAULT_MATCH):
+    '''
+    remove contaminants of the pull-down and check if common proteins in bands
+    returns a dictionary of dataframes with proteins found in bands and pulldown,
+    the significant proteins, the whole (clean) pull-down and the printed summary
+    ratio_caps / ttest_caps : see volcano_transform
+    min_ratio / max_pvalue / correction : significance, see significant
+    match : how accessions are matched between the pull-down and the bands, see accession_def
+    '''
+    # remove contaminants
+    whole_pulld.name = 'pulldown'
+    txt = '\n Pull-down treatment : '
+    pulldown_res, to_add_txt = keep_myc(whole_pulld, None, rules)
+    txt += to_add_txt
+    
+    # for all myc proteins, do -log10 pval and log2 ratio for future plot
+    pulldown_res, zero_ttest, zero_ratio = volcano_transform(pulldown_res, ratio_caps, ttest_caps)
+
+    # if ratio = 0 then its log2 is the lowest cap (-7.78), if ttest = 0 then its -log10 is the highest (6)
+    txt += '\n'
+    if len(zero_ttest):
+        txt += '\n'+' '.join(zero_ttest.astype(str))+' show a t-test of exactly 0. The -Log10 value will be change to '+str(ttest_caps[1])+' (highest).'
+    if len(zero_ratio):
+        txt += '\n'+' '.join(zero_ratio.astype(str))+' show a ratio of exactly 0. The Log2 value will be change to '+str(ratio_caps[0])+' (lowest).'
+    
+    
+    # apply filters : pval <= 0.05 and ratio > 2 by default
+    if correction == 'bh':
+        pulldown_res = add_qvalues(pulldown_res)
+    pulld_access = significant(pulldown_res, min_ratio, max_pvalue, correction)
+    
+    txt += "\n \n There are "+str(len(pulld_access))+" proteins identified with "+significance_text(min_ratio, max_pvalue, correction)+". \n"
+
+    # for each given band, check if accessions in common (significant proteins and bands coded once)
+    pulld_bands = {}
+    index = accession_def.AccessionIndex([pulld_access] + list(clean_df), match)
+
+    for k, df in enumerate(clean_df) : 
+        res_df = pulld_access.loc[index.found_in(0, k+1)]
+        if not res_df.empty :
+            name = PULL_PREFIX+df.name
+            pulld_bands[name] = res_df
+            txt += str((len(res_df)))+" protein.s from "+df.name+" found enriched in pulldown.\n"
+        else : 
+            txt += "No proteins identified in band "+df.name+" were recovered in pulldown.\n"
+
+    return(pulld_bands,pulld_access,pulldown_res, txt)
+
+
+
+def save_pulldown_results(saving_path, pulld_bands, fmt='xlsx', workers=1):
+    # one sheet per band if protein.s in common between band / pulldown
+    # (an excel file needs at least one sheet : empty 'no common protein' sheet if there is none)
+    sheets = list(pulld_bands.items()) or [('no common protein', pd.DataFrame())]
+    return(output_def.write_sheets(saving_path, sheets, fmt, workers))
+
+
+
+def save_top15(saving_path, pulld_top15, fmt='xlsx'):
+    return(output_def.write_sheets(saving_path, [('Sheet1', pulld_top15)], fmt))
+
+
+
+def band_of(name):
+    # band name of a 'pull <band>' table (band names can hold spaces)
+    return(name[len(PULL_PREFIX):] if name.startswith(PULL_PREFIX) else name)
+
+
+def band_highlights(pulld_bands):
+    # highlights of the bands' proteins on a volcano plot, one colour per band (any number of bands)
+    colors = volcano_def.band_colors(len(pulld_bands))
+    return([(df, colors[i], 20, band_of(name), 'Ratio_Log2', 'T_test_Log10')
+            for i, (name, df) in enumerate(pulld_bands.items())])
+
+
+def unique_names(jobs):
+    # a plot whose name is already used gets ' (2)', ' (3)' ... : no plot of a batch overwrites another one
+    used = set()
+    for job in jobs:
+        name = job['name']
+        i = 1
+        while name.lower() in used: # case-insensitive file systems
+            i += 1
+            name = job['name']+' ('+str(i)+')'
+        used.add(name.lower())
+        job['name'] = name
+    return(jobs)
+
+
+def threshold_lines(min_ratio=MIN_RATIO, max_pvalue=MAX_PVALUE, correction=None):
+    # significance lines of a volcano plot (no p-value line with a q-value correction)
+    lines = []
+    if correction is None:
+        pval_line = -np.log10(max_pvalue)
+        lines.append(('h', pval_line, 'p-val. ≤ '+format(max_pvalue, 'g'), 5.3, pval_line+0.02))
+    ratio_line = np.log2(min_ratio)
+    lines.append(('v', ratio_line, 'ratio > '+format(min_ratio, 'g'), ratio_line+0.1, 0))
+    return(lines)
+
+
+
+def volcano_plot(pulldown_res, pulld_access, pulld_bands, path_pd, min_ratio=MIN_RATIO, max_pvalue=MAX_PVALUE, correction=None,
+                 volcano=None):
+    # draw and save the volcano plot, return its path and its png content
+    # thresholds lines at the given significance (no p-value line with a q-value correction)
+    # volcano : template of pulldown_res (volcano_def.Volcano) shared between plots, made if None
+    if volcano is None:
+        volcano = volcano_def.Volcano(pulldown_res)
+
+    highlights = [(pulld_access, 'gold', 12, significance_text(min_ratio, max_pvalue, correction).replace('a ', ''),
+                   'Ratio_Log2', 'T_test_Log10')]
+    highlights += band_highlights(pulld_bands)
+
+    volcano.plot(highlights, 'Volcano plot of identified proteins in pull down, cross resulted with identified proteins in bands\n',
+                 lines=threshold_lines(min_ratio, max_pvalue, correction))
+
+    volcano_saving_path = path_to_save(path_pd,'Volcano plot.png')
+    return(volcano_saving_path, volcano.save(volcano_saving_path))
+
+
+# ranking keys of top_n : column (None : computed, see pi_score), whether the smallest values rank first,
+# and name in the files and plots
+RANK_KEYS = {'ratio' : ('ratio_g1_vs_g2', False, 'Ratio'),
+             'p-value' : ('t_test_g1_vs_g2', True, 'p-value'),
+             'q-value' : ('q_value_BH', True, 'q-value'),
+             'pi-score' : (None, False, 'pi-score')}
+TOP_N = 15
+
+
+def pi_score(pulldown_res):
+    # log2 ratio x -log10 p-value of the transformed pull-down : large for enriched and significant proteins
+    return(pulldown_res['Ratio_Log2'].to_numpy(dtype=float) * pulldown_res['T_test_Log10'].to_numpy(dtype=float))
+
+
+def rank_label(key):
+    # name of a ranking key in the files and plots : 'Ratio', 'pi-score' ...
+    if key in RANK_KEYS:
+        return(RANK_KEYS[key][2])
+    return(getattr(key, '__name__', str(key)))
+
+
+def rank_scores(df, key='ratio'):
+    '''
+    score of each row for top_n, the larger the better (missing : never ranked)
+    key : a RANK_KEYS name, another column (largest first) or a function of df returning the scores
+    '''
+    if callable(key):
+        return(np.asarray(key(df), dtype=float))
+    if key == 'pi-score':
+        return(pi_score(df))
+
+    column, smallest_first, label = RANK_KEYS.get(key, (key, False, key))
+    if key == 'q-value' and column not in df.columns:
+        values = bh_qvalues(df['t_test_g1_vs_g2'])
+    elif column in df.columns:
+        values = df[column].to_numpy(dtype=float)
+    else:
+        raise ValueError('Unknown ranking key "'+str(key)+'" ('+', '.join(RANK_KEYS)+' or a column).')
+    return(-values if smallest_first else values)
+
+
+def top_positions(scores, n):
+    '''
+    positions of the n largest scores, largest first, ties in the rows' order, missing scores never ranked
+    (as Series.nlargest(n, keep='first') on the scores present) : partial selection, only the n selected are sorted
+    '''
+    scores = np.asarray(scores, dtype=float)
+    valid = np.flatnonzero(~np.isnan(scores))
+    values = scores[valid]
+    if n <= 0:
+        return(valid[:0])
+
+    if n < len(values):
+        # n-th largest value, then every value above it and the first ones equal to it
+        kth = np.partition(values, len(values)-n)[len(values)-n]
+        above = np.flatnonzero(values > kth)
+        keep = np.concatenate([above, np.flatnonzero(values == kth)[:n-len(above)]])
+    else:
+        keep = np.arange(len(values))
+    return(valid[keep[np.lexsort((keep, -values[keep]))]])
+
+
+def top_n(df, n=TOP_N, key='ratio', group=None):
+    '''
+    the n best rows of df by key (see rank_scores), best first
+    group : column (or array of labels) : the n best rows of each group, groups in their order of appearance
+    (one sort of the ranked rows by group and score)
+    '''
+    scores = rank_scores(df, key)
+    if group is None:
+        return(df.iloc[top_positions(scores, n)])
+
+    codes = pd.factorize(df[group] if isinstance(group, str) else pd.Series(group))[0]
+    rows = np.flatnonzero(~np.isnan(scores) & (codes >= 0))
+    order = rows[np.lexsort((rows, -scores[rows], codes[rows]))]
+    # rank of each row in its group
+    starts = np.flatnonzero(np.r_[True, codes[order][1:] != codes[order][:-1]])
+    rank = np.arange(len(order)) - np.repeat(starts, np.diff(np.r_[starts, len(order)]))
+    return(df.iloc[order[rank < n]])
+
+
+def top_of_each(frames, n=TOP_N, key='ratio'):
+    # the n best rows of each frame of a dict (pull-down x band, pull-downs ...), see top_n
+    return({name : top_n(df, n, key) for name, df in frames.items()})
+
+
+
+def display_columns(df):
+    # extract nice info to show
+    cols_to_keep = ['accession', 'gene_name', 'description', 'protein_set_score', 'coverage',
+                'MW','ratio_g1_vs_g2', 't_test_g1_vs_g2', 'Ratio_Log2', 'T_test_Log10']
+    df = df[cols_to_keep]
+    df.reset_index(drop=True,inplace=True)
+    #round numbers to display
+    new_df = df.round({'protein_set_score':2,'Ratio_Log2':2, 'T_test_Log10':2})
+
+    # cut description 
+    new_df.insert(2,'Description', df['description'].str.split('OS=').str[0])
+    new_df.drop('description', axis=1,inplace=True)
+
+    # first letter in capitale
+    new_df = new_df.rename(columns=lambda x: x.capitalize())
+    new_df = new_df.rename(columns={'Mw':'MW'})
+
+    # save the rounded df to display
+    return(new_df)
+
+
+
+def get_df_data_to_display(pulld_bands, pulld_access, n=TOP_N, key='ratio'):
+    # display tables of the pull-down x band results, and of the n best significant proteins by key (see top_n) :
+    # only these n rows are formatted
+    pulld_bands_info = {}
+    for k,df in pulld_bands.items():
+        new_df = display_columns(df)
+        pulld_bands_info[k] = new_df
+
+    pulld_top15 = display_columns(top_n(pulld_access, n, key))
+
+    #return the two df
+    return(pulld_bands_info, pulld_top15)
+
+
+
+def top_file_name(n=TOP_N, key='ratio'):
+    # 'Top 15 Ratio.xlsx'
+    return('Top '+str(n)+' '+rank_label(key)+'.xlsx')
+
+
+def top_volcano_name(n=TOP_N, key='ratio'):
+    # 'Volcano plot - 15 best ratio.png'
+    return('Volcano plot - '+str(n)+' best '+rank_label(key).lower()+'.png')
+
+
+def top15_volcano(pulldown_res,pulld_top15,pulld_bands, path_pd, volcano=None, n=TOP_N, key='ratio', min_ratio=MIN_RATIO,
+                  max_pvalue=MAX_PVALUE, correction=None):
+    # plot and save the volcano of the n best proteins by key (see top_n), return its path and its png content
+    # min_ratio, max_pvalue, correction : the significance pulld_top15 was selected with (see significant), for the legend
+    # volcano : template of pulldown_res (volcano_def.Volcano) shared between plots, made if None
+    if volcano is None:
+        volcano = volcano_def.Volcano(pulldown_res)
+
+    best = rank_label(key).lower()
+    significance = significance_text(min_ratio, max_pvalue, correction)[2:]
+    highlights = [(pulld_top15, 'gold', 18, str(n)+' best '+best+' with '+significance, 'Ratio_log2', 'T_test_log10')]
+    highlights += band_highlights(pulld_bands)
+
+    volcano.plot(highlights, 'Volcano plot of identified proteins in pull down, cross resulted with identified proteins in bands\n '+str(n)+' Best '+best+' with '+significance,
+                 hollow=True)
+
+    top15_volcano_saving_path = path_to_save(path_pd,top_volcano_name(n, key))
+    return(top15_volcano_saving_path, volcano.save(top15_volcano_saving_path))
+
+
+
+def volcano_jobs(pulldown_res, pulld_bands, thresholds=((MIN_RATIO, MAX_PVALUE),), top=(TOP_N,), correction=None,
+                 key='ratio'):
+    '''
+    plots of a batch (see volcano_def.render_batch) :
+     - one per band : significant proteins (first threshold) and the proteins of this band
+     - one per threshold : its significant proteins and the proteins of every band
+     - one per top N : the N best by key (see top_n) among the significant proteins (first threshold) and every band
+    '''
+    thresholds = list(thresholds)
+    min_ratio, max_pvalue = thresholds[0]
+    significants = threshold_sweep(pulldown_res, thresholds, correction)
+    first = significants[(min_ratio, max_pvalue)]
+    all_bands = band_highlights(pulld_bands)
+    title = 'Volcano plot of identified proteins in pull down, cross resulted with identified proteins in bands\n'
+    jobs = []
+
+    for band in all_bands:
+        jobs.append({'name' : 'Volcano plot - '+band[3], 'title' : title+band[3],
+                     'highlights' : [(first, 'gold', 12, significance_text(min_ratio, max_pvalue, correction).replace('a ', ''),
+                                      'Ratio_Log2', 'T_test_Log10'), band],
+                     'lines' : threshold_lines(min_ratio, max_pvalue, correction)})
+
+    for (r, p), df in significants.items():
+        jobs.append({'name' : 'Volcano plot - ratio '+format(r, 'g')+' '+tested_value(correction)[0]+' '+format(p, 'g'),
+                     'title' : title,
+                     'highlights' : [(df, 'gold', 12, significance_text(r, p, correction).replace('a ', ''),
+                                      'Ratio_Log2', 'T_test_Log10')] + all_bands,
+                     'lines' : threshold_lines(r, p, correction)})
+
+    label = rank_label(key).lower()
+    for n in top:
+        best = top_n(first, n, key)
+        jobs.append({'name' : 'Volcano plot - '+str(n)+' best '+label, 'title' : title+' '+str(n)+' Best '+label+' with '+significance_text(min_ratio, max_pvalue, correction)[2:],
+                     'highlights' : [(best, 'gold', 18, str(n)+' best '+label, 'Ratio_Log2', 'T_test_Log10')] + all_bands,
+                     'hollow' : True})
+
+    return(unique_names(jobs))
+
+
+
+def batch_volcanoes(pulldown_res, pulld_bands, saving_dir, thresholds=((MIN_RATIO, MAX_PVALUE),), top=(TOP_N,),
+                    correction=None, formats=('png',), workers=1, background='scatter', key='ratio'):
+    # draw and save the plots of volcano_jobs, in every format, return the saved paths
+    jobs = volcano_jobs(pulldown_res, pulld_bands, thresholds, top, correction, key)
+    paths = volcano_def.render_batch(pulldown_res, jobs, saving_dir, formats, workers, background)
+    return([path for job_paths in paths for path in job_paths])
+
+
+
+######################################## Stage cache ########################################
+# same results as the functions above, loaded from a stage_cache_def.StageCache when their inputs did not change
+# (stages None : no cache), each returns its results and whether they were loaded
+
+
+def filter_bands_cached(bands_dict, rules=None, tolerance=0, stages=None):
+    # filter_bands, only for the bands whose data, cut-offs or rules changed ; loaded : number of bands loaded
+    if rules is None:
+        rules = rules_def.get_rules()
+    if stages is None:
+        clean_df, keep_prints = filter_bands(bands_dict, rules, tolerance)
+        return(clean_df, keep_prints, 0)
+
+    keys = {name : stage_cache_def.data_hash(v[0], name, v[1], v[2], tolerance, stage_cache_def.rules_key(rules))
+            for name, v in bands_dict.items()}
+    done = {name : stages.get('filter', key) for name, key in keys.items()}
+    loaded = sum(v is not None for v in done.values())
+
+    # the changed bands are still filtered together
+    missing = {name : v for name, v in bands_dict.items() if done[name] is None}
+    for df, keep_print in zip(*filter_bands(missing, rules, tolerance)):
+        done[df.name] = (df, keep_print)
+        stages.put('filter', keys[df.name], (df, keep_print))
+
+    clean_df = []
+    keep_prints = []
+    for name, (df, keep_print) in done.items():
+        df.name = name # lost in the cache
+        clean_df.append(df)
+        keep_prints.append(keep_print)
+    return(clean_df, keep_prints, loaded)
+
+
+
+def clean_bands_hash(clean_df):
+    # content of the clean bands, input of the stages after the filter
+    return(stage_cache_def.data_hash(*[df.name for df in clean_df], *clean_df))
+
+
+
+def overlap_bands_cached(clean_df, stages=None, match=accession_def.DEFAULT_MATCH):
+    # overlap_bands, never loaded from the stage cache : saving the tables would cut every one of them,
+    # the lazy OverlapTables is cheaper to build again (the written results are still cached, see save_cached)
+    # same returns as the other cached stages (loaded is always False)
+    return(overlap_bands(clean_df, match) + (False,))
+
+
+
+def save_cached(stages, key, save, *args):
+    # save(*args) returns the written paths : not written again if they were written with the same key, unchanged since
+    if stages is not None:
+        paths = stages.written(key)
+        if paths is not None:
+            return(paths, True)
+    paths = save(*args)
+    if stages is not None:
+        stages.mark_written(key, paths)
+    return(paths, False)
+
+
+
+def process_pulldown_cached(whole_pulld, clean_df, rules=None, min_ratio=MIN_RATIO, max_pvalue=MAX_PVALUE,
+                            correction=None, stages=None, match=accession_def.DEFAULT_MATCH):
+    # process_pulldown (default caps)
+    if rules is None:
+        rules = rules_def.get_rules()
+    if stages is None:
+        return(process_pulldown(whole_pulld, clean_df, rules, min_ratio=min_ratio, max_pvalue=max_pvalue,
+                                correction=correction, match=match) + (False,))
+
+    key = stage_cache_def.data_hash(whole_pulld, clean_bands_hash(clean_df), stage_cache_def.rules_key(rules),
+                                    LOG2_RATIO_CAPS, LOG10_TTEST_CAPS, min_ratio, max_pvalue, correction, match)
+    res, loaded = stages.cached('pulldown', key, process_pulldown, whole_pulld, clean_df, rules, LOG2_RATIO_CAPS,
+                                LOG10_TTEST_CAPS, min_ratio, max_pvalue, correction, match)
+    return(res + (loaded,))
+
+
+
+def save_pulldown_files(pulld_bands, pulld_top15, path_pd, fmt='xlsx', workers=1, stages=None, n=TOP_N, key='ratio'):
+    # 'Pulldown-bands cross results' and 'Top 15 Ratio' (see top_file_name) next to path_pd, see save_cached
+    top_path = path_to_save(path_pd,top_file_name(n, key))
+    def save():
+        return(save_pulldown_results(path_to_save(path_pd,'Pulldown-bands cross results.xlsx'), pulld_bands, fmt, workers)
+               + save_top15(top_path, pulld_top15, fmt))
+
+    cache_key = stage_cache_def.data_hash(*pulld_bands, *pulld_bands.values(), pulld_top15, os.path.abspath(path_pd),
+                                          top_path, fmt)
+    return(save_cached(stages, cache_key, save))
+
+
+
+def save_threshold_sweep_cached(pulldown_res, thresholds, saving_path, correction=None, fmt='xlsx', workers=1,
+                                stages=None):
+    # threshold_sweep saved in saving_path (see save_threshold_sweep), see save_cached
+    def save():
+        return(save_threshold_sweep(saving_path, threshold_sweep(pulldown_res, thresholds, correction), fmt, workers,
+                                    correction))
+
+    cache_key = stage_cache_def.data_hash(pulldown_res, [significance_name(r, p, correction) for r, p in thresholds],
+                                          correction, os.path.abspath(saving_path), fmt)
+    return(save_cached(stages, cache_key, save))
+
+
+
+def batch_volcanoes_cached(pulldown_res, pulld_bands, saving_dir, thresholds=((MIN_RATIO, MAX_PVALUE),), top=(TOP_N,),
+                           correction=None, formats=('png',), workers=1, background='scatter', key='ratio', stages=None):
+    # batch_volcanoes, not drawn again if the same plots were saved in saving_dir, unchanged since (see save_cached)
+    cache_key = stage_cache_def.data_hash(pulldown_res, *pulld_bands, *pulld_bands.values(), os.path.abspath(saving_dir),
+                                          [tuple(t) for t in thresholds], list(top), correction, list(formats),
+                                          background, rank_label(key))
+    return(save_cached(stages, cache_key, batch_volcanoes, pulldown_res, pulld_bands, saving_dir, thresholds, top,
+                       correction, formats, workers, background, key))
+
+
+
+def plot_volcanoes(pulldown_res, pulld_access, pulld_bands, pulld_top15, path_pd, min_ratio=MIN_RATIO,
+                   max_pvalue=MAX_PVALUE, correction=None, stages=None, n=TOP_N, key='ratio'):
+    '''
+    volcano_plot and top15_volcano (n best by key) on the same template, or their saved png written again
+    returns the paths and png contents of both plots, and whether they were loaded
+    '''
+    def compute():
+        # both volcano plots share the same template (axes and background drawn once)
+        volcano = volcano_def.Volcano(pulldown_res)
+        volcano_png = volcano_plot(pulldown_res, pulld_access, pulld_bands, path_pd, min_ratio, max_pvalue,
+                                   correction, volcano)[1]
+        top15_png = top15_volcano(pulldown_res, pulld_top15, pulld_bands, path_pd, volcano, n, key, min_ratio,
+                                  max_pvalue, correction)[1]
+        return(volcano_png, top15_png)
+
+    volcano_path = path_to_save(path_pd,'Volcano plot.png')
+    top15_path = path_to_save(path_pd,top_volcano_name(n, key))
+    if stages is None:
+        volcano_png, top15_png = compute()
+        return(volcano_path, volcano_png, top15_path, top15_png, False)
+
+    cache_key = stage_cache_def.data_hash(pulldown_res, pulld_access, pulld_top15, *pulld_bands, *pulld_bands.values(),
+                                          min_ratio, max_pvalue, correction, n, rank_label(key))
+    (volcano_png, top15_png), loaded = stages.cached('plot', cache_key, compute)
+    if loaded:
+        for path, png in ((volcano_path, volcano_png), (top15_path, top15_png)):
+            with open(path, 'wb') as f:
+                f.write(png)
+    return(volcano_path, volcano_png, top15_path, top15_png, loaded)
+
+
+
+######################################## Headless runs ########################################
+
+
+def band_names(bands):
+    # names of the bands of a manifest : given name, else B1, B2, ... in the given order
+    return([band.get('name') or 'B'+str(i+1) for i, band in enumerate(bands)])
+
+
+
+def load_bands(bands, cache=True):
+    '''
+    read the bands of a manifest : [{'file' : path, 'min' : MW, 'max' : MW, 'name' : optional}, ...]
+    min / max in Dalton, missing or None for an open bound
+    returns the bands_dict used everywhere : {'B1' : [dataframe, minimal MW, maximal MW] }
+    '''
+    bands_dict = {}
+    for name, band in zip(band_names(bands), bands):
+        band_df = ingest_def.read_protein_sets(band['file'], cache=cache)
+        band_df.name = name
+        bands_dict[name] = [band_df, band.get('min'), band.get('max')]
+    return(bands_dict)
+
+
+
+def compact_datasets(bands_dict, whole_pulld=None):
+    # bands and pull-down read together made compact, sharing their text categories (see ingest_def.compact)
+    frames = [v[0] for v in bands_dict.values()] + ([] if whole_pulld is None else [whole_pulld])
+    frames = ingest_def.compact(frames)
+    bands_dict = {name : [df] + v[1:] for (name, v), df in zip(bands_dict.items(), frames)}
+    if whole_pulld is not None:
+        whole_pulld = frames[-1]
+    return(bands_dict, whole_pulld)
+
+
+
+def stream_filter_band_cached(name, band, rules, tolerance=0, chunksize=ingest_def.CHUNK_ROWS, stages=None):
+    # stream_filter_band of a band of a manifest, loaded from the stage cache if the file, cut-offs and rules
+    # did not change ; returns the clean dataframe, the contaminants' summary and the number of rows read
+    args = (band['file'], name, band.get('min'), band.get('max'), rules, tolerance, None, chunksize)
+    if stages is None:
+        band_df, keep_print, counts = stream_filter_band(*args)
+        return(band_df, keep_print, counts['rows'])
+    key = stage_cache_def.data_hash(ingest_def.file_hash(band['file']), name, band.get('min'), band.get('max'),
+                                    tolerance, stage_cache_def.rules_key(rules))
+    (band_df, keep_print, counts), loaded = stages.cached('stream', key, stream_filter_band, *args)
+    band_df.name = name # lost in the cache
+    return(band_df, keep_print, counts['rows'])
+
+
+
+def no_step(stage):
+    '''
+    default step of the headless runs (run_band_files, run_pulldown) : nothing measured
+    a step is called for each stage, with step('overlap') as record : ..., the stage adds 'rows_in', 'rows_out'
+    and 'cached' to record (see profiling_def.measure for a step that measures)
+    '''
+    return(contextlib.nullcontext({'stage' : stage}))
+
+
+
+def _filter_band_file(name, band, rules, tolerance, cache, stages, chunksize=None):
+    # read and filter one band, in a worker process
+    # (the .name of a dataframe is lost when sent back, the parent names it again)
+    # chunksize : a csv / tsv band is filtered while it is read (see stream_filter_band)
+    # returns the clean band, its contaminants' summary and the number of rows read
+    if chunksize and ingest_def.is_text_export(band['file']):
+        band_df, keep_print, rows = stream_filter_band_cached(name, band, rules, tolerance, chunksize, stages)
+        return(ingest_def.compact([band_df])[0], keep_print, rows)
+
+    band_df = ingest_def.compact([ingest_def.read_protein_sets(band['file'], cache=cache)])[0]
+    band_df.name = name
+    clean_df, keep_prints, loaded = filter_bands_cached({name : [band_df, band.get('min'), band.get('max')]}, rules,
+                                                        tolerance, stages)
+    return(clean_df[0], keep_prints[0], len(band_df))
+
+
+
+def load_and_filter_bands(bands, rules=None, tolerance=0, workers=1, cache=True, stages=None, chunksize=None):
+    '''
+    read the bands of a manifest (see load_bands) and apply filter_bands (stages : see filter_bands_cached)
+    workers > 1 (None : one per core) : each band is read and filtered in its own process,
+    the results are the same as the serial run, in the same order
+    chunksize : the csv / tsv bands are read chunksize rows at a time and filtered while they are read
+    (see stream_filter_band), same results with a bounded memory
+    returns the list of clean dataframes, the contaminants' summaries and the number of rows read (all the bands)
+    '''
+    if rules is None:
+        rules = rules_def.get_rules()
+    if workers is None:
+        workers = os.cpu_count() or 1
+    workers = min(workers, len(bands))
+    streamed = chunksize and any(ingest_def.is_text_export(band['file']) for band in bands)
+
+    if workers <= 1 and not streamed:
+        bands_dict = compact_datasets(load_bands(bands, cache))[0]
+        clean_df, keep_prints, loaded = filter_bands_cached(bands_dict, rules, tolerance, stages)
+        return(clean_df, keep_prints, sum(len(v[0]) for v in bands_dict.values()))
+
+    names = band_names(bands)
+    args = (names, bands, itertools.repeat(rules), itertools.repeat(tolerance), itertools.repeat(cache),
+            itertools.repeat(stages), itertools.repeat(chunksize))
+    if workers <= 1:
+        done = list(map(_filter_band_file, *args))
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            done = list(pool.map(_filter_band_file, *args))
+
+    clean_df = []
+    keep_prints = []
+    for name, (df, keep_print, rows) in zip(names, done):
+        df.name = name
+        clean_df.append(df)
+        keep_prints.append(keep_print)
+    # each band was made compact on its own : the bands share their categories from now on
+    return(ingest_def.compact(clean_df), keep_prints, sum(rows for df, keep_print, rows in done))
+
+
+
+def bands_results(clean_df, keep_prints, saving_dir, fmt='xlsx', workers=1, stages=None,
+                  match=accession_def.DEFAULT_MATCH, step=None):
+    '''
+    overlaps between the clean bands and results files (fmt : see output_def.write_sheets)
+    stages : stage cache of the written results, see save_cached
+    match : how accessions are matched between bands, see accession_def
+    step : measure of each stage ('overlap', 'write bands'), see no_step
+    returns a dict with the clean bands, the overlap tables, the saved paths and the printed summaries
+    '''
+    step = step or no_step
+    clean_rows = sum(len(df) for df in clean_df)
+    with step('overlap') as record:
+        common_results, common_txt, loaded = overlap_bands_cached(clean_df, stages, match)
+        record['rows_in'] = clean_rows
+
+    saving_path = os.path.join(saving_dir, 'Bands analysis results.xlsx')
+    with step('write bands') as record:
+        saving_paths, record['cached'] = save_cached(stages, stage_cache_def.data_hash(clean_bands_hash(clean_df),
+                                                                                       saving_path, fmt, match),
+                                                     save_bands_results, saving_path, clean_df, common_results, fmt,
+                                                     workers)
+        # the overlap tables are cut when they are written
+        record['rows_in'] = record['rows_out'] = clean_rows + sum(len(df) for df in common_results.values())
+
+    txt = '\n'.join(keep_prints)
+    txt += '\n\nAfter applying the filters eliminating contaminants and non-desired molecular wight, there is :\n'
+    for df in clean_df :
+        txt += str(len(df))+' proteins of interest in '+df.name+'\n'
+    txt += '\n'+common_txt
+
+    return({'clean_df' : clean_df, 'common_results' : common_results, 'saving_paths' : saving_paths, 'txt' : txt})
+
+
+
+def run_bands(bands_dict, saving_dir, rules=None, tolerance=0, fmt='xlsx', match=accession_def.DEFAULT_MATCH):
+    # contaminants' removal, MW cut-offs, overlaps between bands and results files, see bands_results
+    clean_df, keep_prints = filter_bands(bands_dict, rules, tolerance)
+    return(bands_results(clean_df, keep_prints, saving_dir, fmt, match=match))
+
+
+
+def run_band_files(bands, saving_dir, rules=None, tolerance=0, workers=1, cache=True, fmt='xlsx', stages=None,
+                   chunksize=None, match=accession_def.DEFAULT_MATCH, step=None):
+    # same as run_bands from the bands of a manifest, read and filtered by band in parallel (see load_and_filter_bands)
+    # stages : stage cache, only the changed bands are filtered again (see filter_bands_cached)
+    # chunksize : csv / tsv bands filtered while they are read
+    # step : measure of each stage ('read and filter', then see bands_results), see no_step
+    step = step or no_step
+    with step('read and filter') as record:
+        clean_df, keep_prints, record['rows_in'] = load_and_filter_bands(bands, rules, tolerance, workers, cache, stages,
+                                                                         chunksize)
+        record['rows_out'] = sum(len(df) for df in clean_df)
+    return(bands_results(clean_df, keep_prints, saving_dir, fmt, workers, stages, match, step))
+
+
+
+def save_threshold_sweep(saving_path, sweep, fmt='xlsx', workers=1, correction=None):
+    # one sheet per threshold setting of threshold_sweep, named by significance_name (correction : of the sweep)
+    sheets = [(significance_name(min_ratio, max_pvalue, correction), df) for (min_ratio, max_pvalue), df in sweep.items()]
+    return(output_def.write_sheets(saving_path, sheets, fmt, workers))
+
+
+
+def run_pulldown(whole_pulld, clean_df, saving_dir, rules=None, min_ratio=MIN_RATIO, max_pvalue=MAX_PVALUE,
+                 correction=None, thresholds=None, volcanoes=None, workers=1, fmt='xlsx', stages=None, top=TOP_N,
+                 rank='ratio', match=accession_def.DEFAULT_MATCH, step=None):
+    '''
+    pull-down treatment, cross results with the clean bands, results files and volcano plots
+    min_ratio / max_pvalue / correction : significance, see significant
+    match : how accessions are matched between the pull-down and the bands, see accession_def
+    top / rank : the top best significant proteins by rank (see top_n) saved and plotted, 'Top 15 Ratio' by default
+    thresholds : optional [(min_ratio, max_pvalue), ...] also saved in 'Threshold sweep.xlsx'
+    volcanoes : optional batch of plots, {'top' : [15, 30], 'formats' : ['png', 'svg'], 'background' : 'scatter'}
+    saved in a 'Volcano plots' folder (see volcano_jobs, the thresholds are the significance then the sweep),
+    drawn by workers processes
+    fmt : format of the results tables, see output_def.write_sheets
+    stages : stage cache for the treatment, the results files and every plot (see the Stage cache functions)
+    step : measure of each stage ('pulldown', 'write pulldown', 'plot', 'threshold sweep', 'volcanoes'), see no_step
+    returns a dict with every result and saved path, and the printed summary
+    '''
+    step = step or no_step
+    with step('pulldown') as record:
+        pulld_bands, pulld_access, pulldown_res, txt, record['cached'] = process_pulldown_cached(whole_pulld, clean_df,
+                                                                                                 rules, min_ratio,
+                                                                                                 max_pvalue, correction,
+                                                                                                 stages, match)
+        record['rows_in'] = len(whole_pulld)
+        record['rows_out'] = len(pulldown_res)
+    pulld_rows = sum(len(df) for df in pulld_bands.values())
+
+    # volcano and excel paths are built next to a (virtual) pull-down file in saving_dir
+    path_pd = os.path.join(saving_dir, 'pulldown')
+    with step('write pulldown') as record:
+        pulld_bands_info, pulld_top15 = get_df_data_to_display(pulld_bands, pulld_access, top, rank)
+        saving_paths, record['cached'] = save_pulldown_files(pulld_bands, pulld_top15, path_pd, fmt, workers, stages,
+                                                             top, rank)
+        record['rows_in'] = record['rows_out'] = pulld_rows
+
+    with step('plot') as record:
+        volcano_path, volcano_png, top15_path, top15_png, record['cached'] = plot_volcanoes(pulldown_res, pulld_access,
+                                                                                            pulld_bands, pulld_top15,
+                                                                                            path_pd, min_ratio,
+                                                                                            max_pvalue, correction,
+                                                                                            stages, top, rank)
+        record['rows_in'] = len(pulldown_res)
+    saving_paths += [volcano_path, top15_path]
+
+    # same transformed pull-down, other thresholds
+    if thresholds:
+        with step('threshold sweep') as record:
+            paths, record['cached'] = save_threshold_sweep_cached(pulldown_res, thresholds,
+                                                                  path_to_save(path_pd,'Threshold sweep.xlsx'),
+                                                                  correction, fmt, workers, stages)
+            saving_paths += paths
+            record['rows_in'] = len(pulldown_res)
+            record['rows_out'] = sum(int(significant_mask(pulldown_res, r, p, correction).sum()) for r, p in thresholds)
+
+    if volcanoes is not None:
+        with step('volcanoes') as record:
+            batch_dir = os.path.join(saving_dir, 'Volcano plots')
+            os.makedirs(batch_dir, exist_ok=True)
+            paths, record['cached'] = batch_volcanoes_cached(pulldown_res, pulld_bands, batch_dir,
+                                                             [(min_ratio, max_pvalue)] + [tuple(t) for t in thresholds or []],
+                                                             volcanoes.get('top', (top,)), correction,
+                                                             volcanoes.get('formats', ('png',)), workers,
+                                                             volcanoes.get('background', 'scatter'), rank, stages)
+            saving_paths += paths
+            record['rows_in'] = len(pulldown_res)
+
+    return({'pulld_bands' : pulld_bands, 'pulld_access' : pulld_access, 'pulldown_res' : pulldown_res,
+            'pulld_bands_info' : pulld_bands_info, 'pulld_top15' : pulld_top15,
+            'saving_paths' : saving_paths, 'txt' : txt})
+
+
+
+def analysis(bands, bands_path, path_pd=None, rules=None, tolerance=0, cache=True,
+             min_ratio=MIN_RATIO, max_pvalue=MAX_PVALUE, correction=None, stages=None, top=TOP_N, rank='ratio',
+             match=accession_def.DEFAULT_MATCH):
+    '''
+    the whole treatment of the app, stage by stage : yields (stage, results) after each stage
+    stages : 'read', 'filter', 'overlap', 'write' (bands), then with a pull-down 'pulldown', 'write', 'plot'
+    bands : as in load_bands, bands_path : last band file (bands results are saved next to it),
+    path_pd : pull-down file or None (pull-down results are saved next to it)
+    min_ratio / max_pvalue / correction : significance in the pull-down, see significant
+    top / rank : the top best significant proteins by rank, see top_n
+    match : how accessions are matched between bands and with the pull-down, see accession_def
+    cache : read the excel files through their sidecars, and load the results of the stages whose inputs
+    did not change from the stage cache next to the bands (or from stages, a stage_cache_def.StageCache)
+    the results of each stage tell whether they were 'cached' (loaded)
+    the caller can stop between two stages by not asking for the next one (cancel)
+    '''
+    if rules is None:
+        rules = rules_def.get_rules()
+    if cache and stages is None:
+        stages = stage_cache_def.StageCache.next_to(bands_path)
+    if not cache:
+        stages = None
+
+    bands_dict = load_bands(bands, cache)
+    whole_pulld = None
+    if path_pd:
+        whole_pulld = ingest_def.read_protein_sets(path_pd, columns=ingest_def.PULLDOWN_COLUMNS, cache=cache)
+    bands_dict, whole_pulld = compact_datasets(bands_dict, whole_pulld)
+    yield('read', {'bands_dict' : bands_dict, 'whole_pulld' : whole_pulld, 'cached' : False})
+
+    clean_df, keep_prints, loaded = filter_bands_cached(bands_dict, rules, tolerance, stages)
+    yield('filter', {'clean_df' : clean_df, 'keep_prints' : keep_prints, 'target' : rules['target'],
+                     'cached' : loaded == len(bands_dict)})
+
+    common_results, common_txt, loaded = overlap_bands_cached(clean_df, stages, match)
+    yield('overlap', {'common_results' : common_results, 'txt' : common_txt, 'cached' : loaded})
+
+    saving_path = path_to_save(bands_path,'Bands analysis results.xlsx')
+    saving_paths, loaded = save_cached(stages, stage_cache_def.data_hash(clean_bands_hash(clean_df), saving_path, 'xlsx',
+                                                                         match),
+                                       save_bands_results, saving_path, clean_df, common_results)
+    yield('write', {'what' : 'bands', 'saving_paths' : saving_paths, 'cached' : loaded})
+
+    if whole_pulld is None:
+        return
+
+    pulld_bands, pulld_access, pulldown_res, txt, loaded = process_pulldown_cached(whole_pulld, clean_df, rules, min_ratio,
+                                                                                   max_pvalue, correction, stages, match)
+    yield('pulldown', {'pulld_bands' : pulld_bands, 'pulld_access' : pulld_access, 'pulldown_res' : pulldown_res,
+                       'txt' : txt, 'cached' : loaded})
+
+    pulld_bands_info, pulld_top15 = get_df_data_to_display(pulld_bands, pulld_access, top, rank)
+    saving_paths, loaded = save_pulldown_files(pulld_bands, pulld_top15, path_pd, stages=stages, n=top, key=rank)
+    yield('write', {'what' : 'pulldown', 'saving_paths' : saving_paths, 'cached' : loaded})
+
+    volcano_path, volcano_png, top15_path, top15_png, loaded = plot_volcanoes(pulldown_res, pulld_access, pulld_bands,
+                                                                              pulld_top15, path_pd, min_ratio, max_pvalue,
+                                                                              correction, stages, top, rank)
+    yield('plot', {'volcano_path' : volcano_path, 'top15_path' : top15_path,
+                   'volcano_png' : volcano_png, 'top15_png' : top15_png,
+                   'pulld_bands_info' : pulld_bands_info, 'pulld_top15' : pulld_top15, 'cached' : loaded})
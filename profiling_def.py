@@ -0,0 +1,296 @@
+"""
+Instrumentation of the pipeline's stages : where does the time (and memory) of a run go ?
+
+-> each stage is measured : wall time, peak memory during the stage (RSS of the process and of its worker
+   processes, sampled, see rss_peak ; when the OS gives it), rows in and rows out, and whether it was loaded
+   from the stage cache
+-> the records are saved as a json log ('Analysis log.json') and shown in the app as a table
+-> optional deep dive (capture) :
+   'cpu' : cProfile of each stage, its slowest functions in the log (and the .prof files, see pstats / snakeviz)
+   'memory' : tracemalloc, peak of the python / numpy allocations of each stage and the lines allocating the most
+   (both slow the run down)
+-> cold start : import time of modules in a new interpreter (python -X importtime), see import_times and
+   benchmark.py --imports
+"""
+
+import cProfile
+import importlib.util
+import json
+import os
+import platform
+import pstats
+import subprocess
+import sys
+import threading
+import time
+import tracemalloc
+from contextlib import contextmanager
+from datetime import datetime
+
+
+CAPTURES = ('cpu', 'memory')
+LOG_NAME = 'Analysis log.json'
+TOP = 15 # functions / lines kept by a capture
+SAMPLE_SECONDS = 0.02 # memory sampling interval during a stage
+
+
+
+def _proc_rss(pid):
+    # memory of a process (bytes) and its children's pids, from /proc (linux)
+    with open('/proc/'+str(pid)+'/statm') as f:
+        rss = int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    children = []
+    for task in os.listdir('/proc/'+str(pid)+'/task'):
+        with open('/proc/'+str(pid)+'/task/'+task+'/children') as f:
+            children += [int(child) for child in f.read().split()]
+    return(rss, children)
+
+
+def current_rss_mb():
+    '''
+    memory used right now (MB) by the process and all its worker processes (ProcessPoolExecutor), None if unknown
+    psutil if installed, else /proc on linux
+    '''
+    if importlib.util.find_spec('psutil') is not None:
+        import psutil
+        process = psutil.Process()
+        total = process.memory_info().rss
+        for child in process.children(recursive=True):
+            try:
+                total += child.memory_info().rss
+            except psutil.Error:
+                pass # ended meanwhile
+        return(round(total / 2**20, 1))
+
+    if not os.path.exists('/proc/self/statm'):
+        return(None)
+    total = 0
+    pids = [os.getpid()]
+    while pids:
+        pid = pids.pop()
+        try:
+            rss, children = _proc_rss(pid)
+        except (OSError, ValueError, IndexError):
+            continue # ended meanwhile
+        total += rss
+        pids += children
+    return(round(total / 2**20, 1))
+
+
+
+@contextmanager
+def rss_peak(interval=SAMPLE_SECONDS):
+    '''
+    peak memory (MB) of the process and its worker processes during a with block, not since the process started :
+    with rss_peak() as peak : ... then peak['mb'] (None if unknown)
+    sampled every interval by a thread, a peak shorter than interval can be missed
+    '''
+    peak = {'mb' : current_rss_mb()}
+    if peak['mb'] is None:
+        yield peak
+        return
+
+    stop = threading.Event()
+    def sample():
+        while not stop.wait(interval):
+            peak['mb'] = max(peak['mb'], current_rss_mb() or 0)
+
+    sampler = threading.Thread(target=sample, daemon=True)
+    sampler.start()
+    try:
+        yield peak
+    finally:
+        stop.set()
+        sampler.join()
+        peak['mb'] = max(peak['mb'], current_rss_mb() or 0)
+
+
+
+def _top_functions(profiler):
+    # slowest functions of a profile, by cumulative time
+    stats = pstats.Stats(profiler).stats
+    rows = sorted(stats.items(), key=lambda item: item[1][3], reverse=True)[:TOP]
+    return([func+' ('+os.path.basename(file)+':'+str(line)+') '+format(ct, '.3f')+' s, '+str(nc)+' calls'
+            for (file, line, func), (cc, nc, tt, ct, callers) in rows])
+
+
+
+@contextmanager
+def measure(stage, capture=None, profile_path=None):
+    '''
+    measure the code of a with block : with measure('filter') as record : ...
+    record : {'stage', 'seconds', 'peak_rss_mb'} (+ 'peak_alloc_mb' and 'top_allocations' or 'top_functions'
+    with a capture), the block can add its own keys (rows_in, rows_out ...)
+    peak_rss_mb : highest memory of the process and its workers during this block (see rss_peak)
+    profile_path : with the 'cpu' capture, where to save the stage's profile
+    '''
+    record = {'stage' : stage}
+    profiler = None
+    if capture == 'cpu':
+        profiler = cProfile.Profile()
+    elif capture == 'memory':
+        if not tracemalloc.is_tracing():
+            tracemalloc.start()
+        tracemalloc.reset_peak()
+        before = tracemalloc.take_snapshot().filter_traces([tracemalloc.Filter(False, tracemalloc.__file__)])
+
+    try:
+        with rss_peak() as peak:
+            start = time.perf_counter()
+            if profiler is not None:
+                profiler.enable()
+            try:
+                yield record
+            finally:
+                if profiler is not None:
+                    profiler.disable()
+                record['seconds'] = round(time.perf_counter() - start, 4)
+    finally:
+        record['peak_rss_mb'] = peak['mb']
+
+        if profiler is not None:
+            record['top_functions'] = _top_functions(profiler)
+            if profile_path:
+                profiler.dump_stats(profile_path)
+        elif capture == 'memory':
+            record['peak_alloc_mb'] = round(tracemalloc.get_traced_memory()[1] / 2**20, 1)
+            after = tracemalloc.take_snapshot().filter_traces([tracemalloc.Filter(False, tracemalloc.__file__)])
+            record['top_allocations'] = [str(stat) for stat in after.compare_to(before, 'lineno')[:TOP]]
+
+
+
+def _rows(dfs):
+    return(sum(len(df) for df in dfs))
+
+
+def stage_rows(stage, res, state):
+    '''
+    rows in and out of a stage of pipeline_def.analysis, from its results
+    state : what the previous stages gave (updated here)
+    '''
+    if stage == 'read':
+        state['bands'] = _rows(v[0] for v in res['bands_dict'].values())
+        state['pulldown'] = 0 if res['whole_pulld'] is None else len(res['whole_pulld'])
+        return(None, state['bands'] + state['pulldown'])
+
+    if stage == 'filter':
+        state['clean'] = _rows(res['clean_df'])
+        return(state['bands'], state['clean'])
+
+    if stage == 'overlap':
+        state['overlap'] = _rows(res['common_results'].values())
+        return(state['clean'], state['overlap'])
+
+    if stage == 'write' and res['what'] == 'bands':
+        rows = state['clean'] + state['overlap']
+        return(rows, rows)
+
+    if stage == 'pulldown':
+        state['pulld_res'] = len(res['pulldown_res'])
+        state['pulld_bands'] = _rows(res['pulld_bands'].values())
+        return(state['pulldown'], state['pulld_res'])
+
+    if stage == 'write':
+        return(state['pulld_bands'], state['pulld_bands'])
+
+    if stage == 'plot':
+        return(state['pulld_res'], None)
+
+    return(None, None)
+
+
+
+def instrument(stages, capture=None, profile_folder=None):
+    '''
+    measure each stage of a stages generator (pipeline_def.analysis) : yields (stage, results, record)
+    record : see measure, with 'rows_in', 'rows_out' and 'cached'
+    capture : None, 'cpu' or 'memory', see this module's description
+    profile_folder : with the 'cpu' capture, one .prof file per stage saved there
+    '''
+    state = {}
+    i = 0
+    try:
+        while True:
+            profile_path = None
+            if capture == 'cpu' and profile_folder:
+                os.makedirs(profile_folder, exist_ok=True)
+                profile_path = os.path.join(profile_folder, format(i, '02d')+' stage.prof')
+
+            with measure('', capture, profile_path) as record:
+                try:
+                    stage, res = next(stages)
+                except StopIteration:
+                    stage = None
+
+            if stage is None:
+                if profile_path and os.path.exists(profile_path):
+                    os.remove(profile_path)
+                return
+
+            record['stage'] = stage
+            record['rows_in'], record['rows_out'] = stage_rows(stage, res, state)
+            record['cached'] = bool(res.get('cached', False))
+            if profile_path:
+                os.replace(profile_path, os.path.join(profile_folder, format(i, '02d')+' '+stage+'.prof'))
+            i += 1
+            yield(stage, res, record)
+
+    finally:
+        # also when the caller stops early (cancel)
+        if capture == 'memory' and tracemalloc.is_tracing():
+            tracemalloc.stop()
+
+
+
+def summary(records):
+    # one line per stage, as shown under the app's buttons
+    lines = []
+    for r in records:
+        line = r['stage']+' : '+format(r['seconds'], '.1f')+' s'
+        if r.get('cached'):
+            line += ' (cached)'
+        lines.append(line)
+    return(lines)
+
+
+
+def save_log(path, records, **context):
+    # json log of a run : when, where, with what (context), and the stages' records
+    log = {'date' : datetime.now().isoformat(timespec='seconds'), 'python' : platform.python_version(),
+           'platform' : platform.platform(), 'total_seconds' : round(sum(r['seconds'] for r in records), 4)}
+    log.update(context)
+    log['stages'] = records
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump(log, f, indent=1, default=str)
+    return(path)
+
+
+
+def _top_level_imports(statement, cwd=None):
+    # {module : cumulative seconds} of the modules imported by statement in a new interpreter, not by other modules
+    out = subprocess.run([sys.executable, '-X', 'importtime', '-c', statement], capture_output=True, text=True,
+                         cwd=cwd, check=True)
+    times = {}
+    for line in out.stderr.splitlines():
+        if not line.startswith('import time:') or line.count('|') != 2:
+            continue
+        self_us, cumulative, name = line[len('import time:'):].split('|')
+        if cumulative.strip().isdigit() and not name.startswith('  '): # nested imports are indented
+            times[name.strip()] = int(cumulative) / 1e6
+    return(times)
+
+
+def import_times(statements, repeat=1, cwd=None):
+    '''
+    cold import time of modules : { name : [seconds of each repeat] }
+    statements : { name : 'pandas' or 'tkinter, app_def' (imported together) }, each repeat in a new interpreter
+    the modules the interpreter imports on its own (site ...) are not counted
+    '''
+    baseline = set(_top_level_imports('pass', cwd))
+    times = {}
+    for name, modules in statements.items():
+        times[name] = []
+        for _ in range(repeat):
+            imported = _top_level_imports('import '+modules, cwd)
+            times[name].append(round(sum(t for m, t in imported.items() if m not in baseline), 6))
+    return(times)
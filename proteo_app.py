@@ -26,23 +26,47 @@ Lea Masson
 19/02/2024 
 """
 
+import time
+STARTED = time.perf_counter() # cold start of the app, measured from here (see window_shown)
+
+import os
+import queue
+import threading
 import tkinter as tk 
-from PIL import Image, ImageTk
+from tkinter import messagebox, simpledialog
 
-import base64
-import io
+import app_def as app
+import profiling_def as profiling
 
-from tkinter import messagebox, simpledialog, filedialog, ttk
 
-import app_def as app
+# the window only needs tkinter : the analysis modules (auto_prot_def -> pipeline_def, pandas, numpy, matplotlib)
+# are imported once the window is shown, in a background thread (preload), or when Start is clicked
+# with PROTEOCROSS_PRELOAD=0 in the environment
+auto_prot = None
+startup = {} # seconds : 'window' (shown), 'import' (analysis modules), saved in 'Analysis log.json'
+preload = None # preload thread
 
 
-import pandas as pd
-import itertools
-import numpy as np
-import matplotlib.pyplot as plt
+def load_auto_prot():
+    # import the analysis modules once, matplotlib with the Agg backend (plots are drawn in the worker thread)
+    global auto_prot
+    if auto_prot is None:
+        start = time.perf_counter()
+        import matplotlib
+        matplotlib.use('Agg')
+        import auto_prot_def
+        startup['import'] = round(time.perf_counter() - start, 4)
+        auto_prot = auto_prot_def
+    return(auto_prot)
 
-import auto_prot_def as auto_prot
+
+def window_shown():
+    # first idle moment of the Tk loop : the window is on screen, the heavy imports can start
+    global preload
+    startup['window'] = round(time.perf_counter() - STARTED, 4)
+    if os.environ.get('PROTEOCROSS_PRELOAD', '1') != '0':
+        preload = threading.Thread(target = load_auto_prot, daemon = True)
+        preload.start()
 
 
 
@@ -100,45 +124,175 @@ createScrollableContainer()
 
 
 
-# def start : does all when button is clicked
+# the analysis runs in a worker thread : it never touches tkinter, it sends its stages' results in a queue
+# the queue is read by the Tk main loop (root.after) to display them
+events = queue.Queue()
+cancel_event = threading.Event()
+
+
+def worker(bands, bands_path, path_pd, min_ratio, profile):
+    # run pipeline_def.analysis stage by stage, stop between two stages if cancelled
+    # profile : name of the contaminants' rule set (see rules_profile)
+    # each stage is measured (see profiling_def), the records are saved in 'Analysis log.json' next to the bands
+    # PROTEOCROSS_PROFILE=cpu or memory in the environment for a deep dive
+    # PROTEOCROSS_STORE=results.sqlite in the environment : the finished run is also saved there (see store_def)
+    records = []
+    results = {}
+    try :
+        capture = os.environ.get('PROTEOCROSS_PROFILE') or None
+        stages = auto_prot.analysis(bands, bands_path, path_pd, rules=auto_prot.get_rules(profile), min_ratio=min_ratio)
+        ending = 'done'
+        for stage, res, record in profiling.instrument(stages, capture, auto_prot.path_to_save(bands_path, 'Profiles')):
+            records.append(record)
+            results.update(res)
+            events.put(('stage', stage, record, res))
+            if cancel_event.is_set():
+                ending = 'cancelled'
+                break
+
+        log_path = profiling.save_log(auto_prot.path_to_save(bands_path, profiling.LOG_NAME), records, ending=ending,
+                                      capture=capture, bands=bands, pulldown=path_pd, min_ratio=min_ratio,
+                                      rules=profile, startup=startup)
+        if ending == 'done' and os.environ.get('PROTEOCROSS_STORE'):
+            store_run(os.environ['PROTEOCROSS_STORE'], bands, bands_path, path_pd, min_ratio, profile, results)
+        events.put((ending, None, records, log_path))
+
+    except Exception as e :
+        events.put(('error', None, records, e))
+
+
+def rules_profile():
+    # contaminants' rule set of the analysis : PROTEOCROSS_RULES=ecoli in the environment (a profile of rules.json,
+    # see rules_def), the default one otherwise ; an unknown profile is refused before the files are asked
+    profile = os.environ.get('PROTEOCROSS_RULES') or auto_prot.DEFAULT_PROFILE
+    auto_prot.get_rules(profile)
+    return(profile)
+
+
+def store_run(store_path, bands, bands_path, path_pd, min_ratio, profile, results):
+    # save the clean bands and the pull-down of a finished run in the results store, named after the bands' folder
+    import store_def
+    pulldowns = {}
+    if path_pd:
+        pulldowns[os.path.splitext(os.path.basename(path_pd))[0]] = (results['pulldown_res'], min_ratio,
+                                                                      auto_prot.MAX_PVALUE, None)
+    folder = os.path.dirname(os.path.abspath(bands_path))
+    bands_mw = {df.name : (b.get('min'), b.get('max')) for df, b in zip(results['clean_df'], bands)}
+    params = {'bands' : bands, 'pulldown' : path_pd, 'min_ratio' : min_ratio, 'rules' : profile}
+    # the same files and parameters analysed again replace the saved run
+    key = store_def.run_key(params, [b['file'] for b in bands] + ([path_pd] if path_pd else []))
+    store = store_def.ResultsStore(store_path)
+    return(store.add_run(os.path.basename(folder), results['clean_df'], pulldowns, params, folder, bands_mw, key=key))
+
+
+def poll_events(state):
+    # display what the worker sent, come back every 100 ms until the analysis is over
+    try :
+        while True :
+            kind, stage, record, res = events.get_nowait()
+
+            if kind == 'stage':
+                state['records'].append(record)
+                state['timings'] = profiling.summary(state['records'])
+                progress.set('\n'.join(state['timings'])+'\n... running')
+
+                if stage == 'read':
+                    app.display_given_data(auto_prot.given_data_prints(res['bands_dict']), right_frame) # row 1 on grid 
+                else :
+                    state['row'] = auto_prot.display_stage(stage, res, right_frame, state['row'])
+                app.updateScrollRegion(cTableContainer, right_frame)
+
+            else :
+                if kind == 'done' and not state['pulldown']:
+                    tk.Label(right_frame, text = 'Thanks for using this automated program!').grid(row = state['row'], column = 0, padx = 30, pady = 10)
+                    state['row'] += 1
+                if kind == 'error':
+                    messagebox.showinfo('Error!', res)
+                # where the time went : one row per stage
+                if record:
+                    state['row'] = auto_prot.display_timings(record, right_frame, state['row'])
+                app.updateScrollRegion(cTableContainer, right_frame)
+
+                ending = {'done' : 'done', 'cancelled' : 'cancelled', 'error' : 'stopped on error'}[kind]
+                progress.set('\n'.join(state['timings'])+'\n'+ending)
+                start_button.config(state = tk.NORMAL)
+                cancel_button.config(state = tk.DISABLED)
+                return
+
+    except queue.Empty :
+        pass
+
+    root.after(100, poll_events, state)
+
+
+
+# def start : asks the data when button is clicked, then runs the analysis in the background
 
 def start():
     
     try : 
-         # 1) how many bands were cut ? -> Enter the number, launch def "get_data" 
-        how_many = tk.simpledialog.askinteger(' ', 'How many bands were cut ?')
-                # ask for the bands, create 
-        bands_dict, prints, bands_path = auto_prot.get_data(how_many)
-                # display given info  
-        app.display_given_data(prints, right_frame) # row 1 on grid 
-        app.updateScrollRegion(cTableContainer, right_frame)
-        
-        current_row = 2
-
-        # 2) automatic bands treatment -> see functions in auto_proteo_def.py
-        clean_df, current_row = auto_prot.bands(bands_dict, bands_path, right_frame, current_row)
-        app.updateScrollRegion(cTableContainer, right_frame)
-
-        # 3) automanic pulldown cross-result with bands -> see functions in auto_proteo_def.py
-        pulldown = tk.messagebox.askyesno('Pulldown', 'Do you have pulldown results to cross with your bands?')
-
+        # analysis modules : wait for the preload (or import them now)
+        if auto_prot is None:
+            progress.set('loading ...')
+            root.update_idletasks()
+            if preload is not None:
+                preload.join()
+            load_auto_prot()
+            progress.set('')
+        profile = rules_profile()
+
+         # 1) how many bands were cut ? -> Enter the number, launch def "ask_bands" 
+        how_many = simpledialog.askinteger(' ', 'How many bands were cut ?')
+        if not how_many :
+            return
+                # ask for the bands and their cut-offs
+        bands, bands_path = auto_prot.ask_bands(how_many)
+
+        # 2) pulldown to cross-result with the bands ?
+        path_pd = None
+        min_ratio = auto_prot.MIN_RATIO
+        pulldown = messagebox.askyesno('Pulldown', 'Do you have pulldown results to cross with your bands?')
         if pulldown :
-            auto_prot.pulldown_treatment(clean_df, right_frame, current_row)
-            app.updateScrollRegion(cTableContainer, right_frame)
+            path_pd = auto_prot.ask_pulldown()
+            min_ratio = auto_prot.ask_min_ratio()
 
-        else : 
-            ending = tk.Label(right_frame, 'Thanks for using this automated program!').grid(row = 8, column = 0, padx = 30, pady = 10)
-            app.updateScrollRegion(cTableContainer, right_frame)
-        
     except Exception  as e : 
         messagebox.showinfo('Error!', e) 
+        return
+
+    # 3) automatic bands and pulldown treatment in the background -> see analysis in pipeline_def.py
+    for widget in right_frame.winfo_children():
+        widget.destroy()
+    cancel_event.clear()
+    start_button.config(state = tk.DISABLED)
+    cancel_button.config(state = tk.NORMAL)
+    progress.set('read : running')
+
+    threading.Thread(target = worker, args = (bands, bands_path, path_pd, min_ratio, profile), daemon = True).start()
+    root.after(100, poll_events, {'row' : 2, 'timings' : [], 'records' : [], 'pulldown' : path_pd is not None})
+
+
+def cancel():
+    # the worker stops at the end of its current stage
+    cancel_event.set()
+    progress.set(progress.get().replace('... running', '... cancelling'))
 
 
 # add a start button
 start_button = tk.Button(left_frame, text = 'Start', font = ('Arial',14), bd = 3, relief = 'ridge',
-                         command = start).grid(row=2, column=0, padx=15, pady=10, ipadx = 10)
+                         command = start)
+start_button.grid(row=2, column=0, padx=15, pady=10, ipadx = 10)
+
+# add a cancel button and the stages' progress
+cancel_button = tk.Button(left_frame, text = 'Cancel', font = ('Arial',12), bd = 3, relief = 'ridge',
+                          command = cancel, state = tk.DISABLED)
+cancel_button.grid(row=5, column=0, padx=15, pady=10, ipadx = 10)
+
+progress = tk.StringVar(value = '')
+progress_label = tk.Label(left_frame, textvariable = progress, font = ('Arial',10), justify = 'left', wraplength=210)
+progress_label.grid(row=6, column=0, padx=10, pady=10)
 
 
 # start the app    
+root.after_idle(window_shown)
 root.mainloop()
-
@@ -0,0 +1,346 @@
+"""
+Command line / batch entry point : runs the whole proteomics cross-results pipeline without any window.
+
+    python proteocross.py manifest.json [--out FOLDER] [--rules PROFILE] [--rules-file FILE] [--no-cache] [--workers N]
+                          [--format xlsx|csv|parquet|long] [--capture cpu|memory] [--chunksize ROWS]
+                          [--match exact|accession|protein] [--store results.sqlite]
+                          [--store-duplicates replace|skip|keep]
+    python proteocross.py experiments/ other_manifest.json ... [--workers N]
+
+Manifest (json) :
+    {
+        "bands" : [
+            {"file" : "band1.xlsx", "min" : 20000, "max" : 80000},
+            {"file" : "band2.xlsx", "min" : 50000, "name" : "B2 high"},
+            ...
+        ],
+        "pulldown" : "pulldown.xlsx",
+        "pulldowns" : [{"file" : "pulldown.xlsx", "name" : "WT"}, {"file" : "mutant.xlsx", "name" : "mutant"}],
+        "output" : "results",
+        "rules" : "myc",
+        "tolerance" : 0,
+        "min_ratio" : 2,
+        "max_pvalue" : 0.05,
+        "correction" : "bh",
+        "top" : 15,
+        "rank" : "ratio",
+        "thresholds" : [[2, 0.05], [4, 0.01]],
+        "volcanoes" : {"top" : [15, 30], "formats" : ["png", "svg", "pdf"], "background" : "scatter"},
+        "format" : "xlsx",
+        "chunksize" : 100000,
+        "match" : "protein",
+        "name" : "WT vs mutant, May",
+        "store" : "results.sqlite",
+        "store_duplicates" : "replace"
+    }
+ - molecular weights in Dalton, a missing "min" or "max" is an open bound
+ - "pulldown", "output" (default : the manifest's folder), "rules" (default : myc) and "tolerance" are optional
+ - pull-down significance (optional) : ratio > "min_ratio" (default 2) and p-value <= "max_pvalue" (default 0.05),
+   "correction" : "bh" to use Benjamini-Hochberg q-values, "thresholds" : other [ratio, p-value] settings
+   saved in 'Threshold sweep.xlsx'
+ - "top" / "rank" (optional) : the "top" (default 15) best significant proteins saved and plotted, ranked by
+   "rank" : "ratio" (default), "p-value", "q-value", "pi-score" (log2 ratio x -log10 p-value) or another column
+ - "pulldowns" (optional) : several pull-downs compared at once (names : P1, P2 ... if not given), with the
+   same significance : 'Pull-downs comparison.xlsx' (matrix of the ratios, p-values and enrichment by accession,
+   presence in the bands, UpSet intersections, pairs, top proteins of each) and its UpSet plot, see comparison_def
+ - "volcanoes" (optional) : one volcano plot per band, per threshold and per top N, in each format,
+   saved in a 'Volcano plots' folder ("background" : "hexbin" for a density background)
+ - "format" (optional, default xlsx) : format of the results tables, "csv" or "parquet" (one file per sheet,
+   in a folder named after the excel file) or "long" (one csv with a 'sheet' column), see output_def
+ - bands and pull-downs can be excel files ("Protein sets" sheet) or csv / tsv exports (.csv, .tsv, .txt, also .gz)
+ - "chunksize" (optional) : csv / tsv bands are read by chunks of this many rows, each chunk is filtered
+   (contaminants, MW cut-offs) as soon as it is read : the memory stays bounded whatever the size of the export
+ - "match" (optional) : how accessions are matched between bands and pull-downs, "protein" (default :
+   'sp|P9WGR1|CLPB_MYCTU', 'P9WGR1' and its isoforms 'P9WGR1-2' are the same protein), "accession" (isoforms
+   kept apart) or "exact" (as written), see accession_def
+ - "store" (optional) : SQLite file where the run is also saved (clean bands, pull-downs, overlaps, parameters),
+   under "name" (default : the output folder's name), searched with proteostore.py (see store_def) ;
+   the same run saved again (same parameters and input files) replaces the saved one, "store_duplicates" :
+   "skip" keeps the saved one, "keep" saves both
+ - relative paths are relative to the manifest's folder
+
+The same excel and png results as the app are written in the output folder, the summaries are printed.
+The time, peak memory and rows of each stage (read and filter, overlap, writing, pull-down, plots ...) are saved in
+'Analysis log.json' (see profiling_def).
+
+Parallel runs (--workers, default : one per core, 1 for a serial run) :
+ - one manifest : each band is read and filtered in its own process
+ - several manifests, or folders of manifests (every .json inside) : each experiment runs in its own process,
+   with --out each experiment writes in its own sub-folder named after its manifest, without --out the experiments
+   sharing the same output folder (manifests of one folder, by default) each write in a sub-folder of it
+   named after their manifest : no experiment overwrites the results of another one
+"""
+
+import argparse
+import contextlib
+import json
+import os
+import sys
+from concurrent.futures import ProcessPoolExecutor
+
+import matplotlib
+matplotlib.use('Agg') # no display
+
+import accession_def
+import comparison_def
+import ingest_def
+import output_def
+import pipeline_def
+import profiling_def
+import rules_def
+import stage_cache_def
+import store_def
+
+
+
+def read_manifest(path):
+    # load the manifest and resolve its paths from its own folder
+    with open(path, encoding='utf-8') as f:
+        manifest = json.load(f)
+
+    if not manifest.get('bands'):
+        raise ValueError('The manifest needs at least one band : "bands" : [{"file" : ..., "min" : ..., "max" : ...}]')
+
+    folder = os.path.dirname(os.path.abspath(path))
+    resolve = lambda p : p if os.path.isabs(p) else os.path.join(folder, p)
+
+    for band in manifest['bands']:
+        band['file'] = resolve(band['file'])
+    if manifest.get('pulldown'):
+        manifest['pulldown'] = resolve(manifest['pulldown'])
+    for pulld in manifest.get('pulldowns') or []:
+        pulld['file'] = resolve(pulld['file'])
+    manifest['output'] = resolve(manifest.get('output') or '.')
+    if manifest.get('store'):
+        manifest['store'] = resolve(manifest['store'])
+    store_def.check_duplicates(manifest.get('store_duplicates', 'replace'))
+
+    return(manifest)
+
+
+
+def find_manifests(paths):
+    # manifests given directly, or every .json file of the given folders (sorted)
+    manifests = []
+    for path in paths:
+        if os.path.isdir(path):
+            manifests += sorted(os.path.join(path, f) for f in os.listdir(path) if f.endswith('.json'))
+        else:
+            manifests.append(path)
+    return(manifests)
+
+
+
+def experiment_outputs(manifests, out=None):
+    '''
+    output folder of each of several experiments : a sub-folder of out named after the manifest,
+    else the manifest's output, or a sub-folder of it named after the manifest if other experiments share it
+    '''
+    stems = [os.path.splitext(os.path.basename(m))[0] for m in manifests]
+    if out:
+        return([os.path.join(os.path.abspath(out), stem) for stem in stems])
+
+    outputs = [os.path.normcase(os.path.normpath(read_manifest(m)['output'])) for m in manifests]
+    shared = {o for o in outputs if outputs.count(o) > 1}
+    outs = [os.path.join(o, stem) if o in shared else None for o, stem in zip(outputs, stems)]
+    # two manifests of the same name in different folders with the same output
+    folders = [os.path.normcase(o) for o in outs if o]
+    if len(folders) != len(set(folders)):
+        raise ValueError('Several experiments would write in the same folder : give them different "output" or manifest names.')
+    return(outs)
+
+
+
+def run(manifest, rules=None, cache=True, workers=1, capture=None):
+    '''
+    run the bands (and pull-down) pipeline of a manifest, return the results
+    each stage is measured (see pipeline_def.no_step), the records are saved in 'Analysis log.json' in the output
+    folder (see profiling_def),
+    capture : None, 'cpu' or 'memory' (deep dive, .prof files in a 'Profiles' folder with 'cpu')
+    '''
+    if rules is None:
+        rules = rules_def.get_rules(manifest.get('rules', rules_def.DEFAULT_PROFILE))
+    os.makedirs(manifest['output'], exist_ok=True)
+
+    fmt = manifest.get('format', 'xlsx')
+    match = accession_def.check_match(manifest.get('match', accession_def.DEFAULT_MATCH))
+    # results of the stages whose inputs did not change since the last run are loaded (see stage_cache_def)
+    stages = None
+    if cache:
+        stages = stage_cache_def.StageCache(os.path.join(manifest['output'], ingest_def.CACHE_FOLDER,
+                                                         stage_cache_def.STAGES_FOLDER))
+    records = []
+    profiles = os.path.join(manifest['output'], 'Profiles') if capture == 'cpu' else None
+    if profiles:
+        os.makedirs(profiles, exist_ok=True)
+
+    @contextlib.contextmanager
+    def step(name):
+        # measure of a stage, its record is kept for the log
+        record_path = os.path.join(profiles, format(len(records), '02d')+' '+name+'.prof') if profiles else None
+        with profiling_def.measure(name, capture, record_path) as record:
+            yield record
+        records.append(record)
+
+    results = {'bands' : pipeline_def.run_band_files(manifest['bands'], manifest['output'], rules,
+                                                      manifest.get('tolerance', 0), workers, cache, fmt, stages,
+                                                      manifest.get('chunksize'), match, step)}
+
+    if manifest.get('pulldown'):
+        with step('read pulldown') as record:
+            whole_pulld = ingest_def.read_protein_sets(manifest['pulldown'], columns=ingest_def.PULLDOWN_COLUMNS, cache=cache)
+            # the pull-down shares the text categories of the clean bands (see ingest_def.compact)
+            frames = ingest_def.compact(results['bands']['clean_df'] + [whole_pulld])
+            results['bands']['clean_df'], whole_pulld = frames[:-1], frames[-1]
+            record['rows_out'] = len(whole_pulld)
+
+        results['pulldown'] = pipeline_def.run_pulldown(whole_pulld, results['bands']['clean_df'], manifest['output'],
+                                                        rules, manifest.get('min_ratio', pipeline_def.MIN_RATIO),
+                                                        manifest.get('max_pvalue', pipeline_def.MAX_PVALUE),
+                                                        manifest.get('correction'), manifest.get('thresholds'),
+                                                        manifest.get('volcanoes'), workers, fmt, stages,
+                                                        manifest.get('top', pipeline_def.TOP_N),
+                                                        manifest.get('rank', 'ratio'), match, step)
+
+    if manifest.get('pulldowns'):
+        with step('compare pulldowns') as record:
+            pulldowns = comparison_def.load_pulldowns(manifest['pulldowns'], cache)
+            frames = ingest_def.compact(results['bands']['clean_df'] + list(pulldowns.values()))
+            clean_df = frames[:len(results['bands']['clean_df'])]
+            pulldowns = dict(zip(pulldowns, frames[len(clean_df):]))
+            results['comparison'] = comparison_def.run_comparison(pulldowns, clean_df, manifest['output'], rules,
+                                                                  manifest.get('min_ratio', pipeline_def.MIN_RATIO),
+                                                                  manifest.get('max_pvalue', pipeline_def.MAX_PVALUE),
+                                                                  manifest.get('correction'), fmt, workers, stages,
+                                                                  manifest.get('top', pipeline_def.TOP_N),
+                                                                  manifest.get('rank', 'ratio'), match)
+            record['rows_in'] = sum(len(df) for df in pulldowns.values())
+            record['rows_out'] = len(results['comparison']['matrix'])
+
+    if manifest.get('store'):
+        with step('store') as record:
+            results['run_id'] = store_run(manifest, results, rules, pulldowns if manifest.get('pulldowns') else {}, match)
+            record['rows_in'] = sum(len(df) for df in results['bands']['clean_df'])
+
+    results['records'] = records
+    results['log_path'] = profiling_def.save_log(os.path.join(manifest['output'], profiling_def.LOG_NAME), records,
+                                                 capture=capture, workers=workers, manifest=manifest)
+    return(results)
+
+
+
+def store_run(manifest, results, rules, pulldowns, match):
+    # save the run in the results store of the manifest, the compared pull-downs treated again (see store_def)
+    significance = (manifest.get('min_ratio', pipeline_def.MIN_RATIO), manifest.get('max_pvalue', pipeline_def.MAX_PVALUE),
+                    manifest.get('correction'))
+    treated = {}
+    if 'pulldown' in results:
+        name = os.path.splitext(os.path.basename(manifest['pulldown']))[0]
+        treated[name] = (results['pulldown']['pulldown_res'],) + significance
+    for name, df in pulldowns.items():
+        treated[name] = (comparison_def.treat_pulldown(df, rules, *significance)[0],) + significance
+
+    bands_mw = {name : (band.get('min'), band.get('max'))
+                for name, band in zip(pipeline_def.band_names(manifest['bands']), manifest['bands'])}
+    # the same manifest on the same files (and rules) is the same run
+    files = [band['file'] for band in manifest['bands']] + [pulld['file'] for pulld in manifest.get('pulldowns') or []]
+    if manifest.get('pulldown'):
+        files.append(manifest['pulldown'])
+    key = store_def.run_key(manifest, files, stage_cache_def.rules_key(rules))
+
+    store = store_def.ResultsStore(manifest['store'])
+    return(store.add_run(manifest.get('name') or os.path.basename(os.path.normpath(manifest['output'])),
+                         results['bands']['clean_df'], treated, manifest, manifest['output'], bands_mw, match, key,
+                         manifest.get('store_duplicates', 'replace')))
+
+
+
+def summary(results):
+    # printed summary of a run
+    txt = results['bands']['txt']
+    txt += '\n\nBands results saved in '+', '.join(results['bands']['saving_paths'])
+    if 'pulldown' in results:
+        txt += '\n'+results['pulldown']['txt']
+        txt += 'Pull-down results saved in :\n'+'\n'.join(results['pulldown']['saving_paths'])
+    if 'comparison' in results:
+        txt += '\n'+results['comparison']['txt']
+        txt += 'Comparison saved in :\n'+'\n'.join(results['comparison']['saving_paths'])
+    if 'run_id' in results:
+        txt += '\n\nRun saved as run '+str(results['run_id'])+' in the results store (see proteostore.py)'
+    if 'records' in results:
+        txt += '\n\nTimings ('+results['log_path']+') :\n'+'\n'.join(profiling_def.summary(results['records']))
+    return(txt)
+
+
+
+def run_experiment(path, out=None, profile=None, rules_file=None, cache=True, workers=1, fmt=None, capture=None,
+                   chunksize=None, match=None, store=None, store_duplicates=None):
+    # read a manifest and run it, return its printed summary (only text goes back from a worker process)
+    manifest = read_manifest(path)
+    if out:
+        manifest['output'] = out
+    if fmt:
+        manifest['format'] = fmt
+    if chunksize:
+        manifest['chunksize'] = chunksize
+    if match:
+        manifest['match'] = match
+    if store:
+        manifest['store'] = store
+    if store_duplicates:
+        manifest['store_duplicates'] = store_duplicates
+    rules = rules_def.get_rules(profile or manifest.get('rules', rules_def.DEFAULT_PROFILE), rules_file)
+    return(summary(run(manifest, rules, cache, workers, capture)))
+
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='proteocross', description='Proteomics cross-results : bands and pull-down, without the app.')
+    parser.add_argument('manifest', nargs='+', help='json file(s) describing the bands (file, min, max) and the optional pull-down, or folder(s) of such files')
+    parser.add_argument('--out', help='output folder (overrides the manifest)')
+    parser.add_argument('--rules', help='rule set name (overrides the manifest), see rules.json')
+    parser.add_argument('--rules-file', help='other rules file with the same structure as rules.json')
+    parser.add_argument('--no-cache', action='store_true', help='always read the excel files and compute every stage, without cache')
+    parser.add_argument('--format', choices=output_def.FORMATS, help='format of the results tables (overrides the manifest, default : xlsx)')
+    parser.add_argument('--capture', choices=profiling_def.CAPTURES, help='profile each step (cpu : cProfile, memory : tracemalloc), see the log')
+    parser.add_argument('--chunksize', type=int, help='read csv / tsv bands by chunks of this many rows, filtered as they are read (overrides the manifest)')
+    parser.add_argument('--match', choices=accession_def.MATCHES, help='how accessions are matched between bands and pull-downs (overrides the manifest, default : protein)')
+    parser.add_argument('--store', help='SQLite results store where the run is also saved (overrides the manifest), see proteostore.py')
+    parser.add_argument('--store-duplicates', choices=store_def.DUPLICATES,
+                        help='the same run (parameters and input files) already in the store : replace it (default), skip the new one or keep both')
+    parser.add_argument('--workers', type=int, default=None, help='number of processes (default : one per core, 1 : serial)')
+    args = parser.parse_args(argv)
+
+    workers = args.workers or os.cpu_count() or 1
+    cache = not args.no_cache
+    store = os.path.abspath(args.store) if args.store else None
+
+    try:
+        manifests = find_manifests(args.manifest)
+        if not manifests:
+            raise ValueError('No manifest found in '+', '.join(args.manifest)+'.')
+
+        if len(manifests) == 1:
+            out = os.path.abspath(args.out) if args.out else None
+            print(run_experiment(manifests[0], out, args.rules, args.rules_file, cache, workers, args.format,
+                                 args.capture, args.chunksize, args.match, store, args.store_duplicates))
+            return(0)
+
+        # several experiments : one process per experiment, bands read serially inside
+        outs = experiment_outputs(manifests, args.out)
+        with ProcessPoolExecutor(max_workers=min(workers, len(manifests))) as pool:
+            jobs = [pool.submit(run_experiment, m, o, args.rules, args.rules_file, cache, 1, args.format, args.capture,
+                                args.chunksize, args.match, store, args.store_duplicates) for m, o in zip(manifests, outs)]
+            for m, job in zip(manifests, jobs):
+                print('######## '+m+'\n'+job.result()+'\n')
+
+    except (OSError, ValueError, KeyError) as e:
+        print('Error! '+str(e), file=sys.stderr)
+        return(1)
+
+    return(0)
+
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,106 @@
+"""
+Command line of the results store (see store_def) : search every saved run at once.
+
+    python proteostore.py results.sqlite runs
+    python proteostore.py results.sqlite find P9WGR1 [--enriched]
+    python proteostore.py results.sqlite find clpB
+    python proteostore.py results.sqlite shared 12 B1 B2
+    python proteostore.py results.sqlite sql "SELECT pulldown, COUNT(*) FROM pulldown_proteins WHERE enriched = 1 GROUP BY pulldown"
+    python proteostore.py results.sqlite delete 12
+    (--csv FILE : also save the table(s) found)
+
+ - runs : every saved run (id, name, date, output folder, bands and pull-downs), latest first
+ - find : the clean bands and pull-downs of every run where a protein was identified, any written form of its
+   accession ('sp|P9WGR1|CLPB_MYCTU', 'P9WGR1', 'P9WGR1-2') or its gene name (any case), --enriched : only the
+   pull-downs where it was enriched ; entry names alone ('CLPB_MYCTU') are not searched
+ - shared : the proteins found in both bands of a run, matched as in the run (see store_def.SHARED_QUERY)
+ - sql : any query on the tables (see store_def for their columns)
+ - delete : remove a run from the store
+
+Runs are saved with proteocross.py (--store, or "store" in the manifest).
+"""
+
+import argparse
+import os
+import sqlite3
+import sys
+
+import pandas as pd
+
+import store_def
+
+
+
+def show(df, title=None, csv=None):
+    # printed table, also saved as csv if asked
+    txt = (title+' :\n' if title else '')
+    txt += df.to_string(index=False) if len(df) else '(nothing)'
+    if csv:
+        df.to_csv(csv, index=False)
+    return(txt)
+
+
+def csv_path(csv, part):
+    # one csv per table of find : 'found.csv' -> 'found bands.csv', 'found pulldowns.csv'
+    if not csv:
+        return(None)
+    stem, ext = os.path.splitext(csv)
+    return(stem+' '+part+(ext or '.csv'))
+
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='proteostore', description='Search the runs saved in a Proteocross results store.')
+    parser.add_argument('store', help='SQLite results store (see proteocross.py --store)')
+    parser.add_argument('--csv', help='also save the table(s) as csv')
+    commands = parser.add_subparsers(dest='command', required=True)
+    commands.add_parser('runs', help='every saved run')
+    find = commands.add_parser('find', help='where was a protein identified / enriched')
+    find.add_argument('accession', help='accession in any written form (sp|P9WGR1|CLPB_MYCTU, P9WGR1, P9WGR1-2) '
+                                        'or gene name (any case) ; entry names alone (CLPB_MYCTU) are not searched')
+    find.add_argument('--enriched', action='store_true', help='only the pull-downs where it was enriched')
+    shared = commands.add_parser('shared', help='proteins of a run found in both bands')
+    shared.add_argument('run_id', type=int)
+    shared.add_argument('band_a')
+    shared.add_argument('band_b')
+    sql = commands.add_parser('sql', help='any query on the tables')
+    sql.add_argument('query')
+    delete = commands.add_parser('delete', help='remove a run')
+    delete.add_argument('run_id', type=int)
+    args = parser.parse_args(argv)
+
+    try:
+        if not os.path.exists(args.store):
+            raise OSError('No results store '+args.store+'.')
+        store = store_def.ResultsStore(args.store)
+
+        if args.command == 'runs':
+            print(show(store.runs(), None, args.csv))
+
+        elif args.command == 'find':
+            found = store.find(args.accession, args.enriched)
+            if found['bands'] is not None:
+                print(show(found['bands'], 'Bands', csv_path(args.csv, 'bands'))+'\n')
+            print(show(found['pulldowns'], 'Pull-downs', csv_path(args.csv, 'pulldowns')))
+
+        elif args.command == 'shared':
+            print(show(store.shared(args.run_id, args.band_a, args.band_b), None, args.csv))
+
+        elif args.command == 'sql':
+            print(show(store.query(args.query), None, args.csv))
+
+        elif args.command == 'delete':
+            if not store.delete_run(args.run_id):
+                raise ValueError('No run '+str(args.run_id)+' in '+args.store+'.')
+            print('Run '+str(args.run_id)+' deleted.')
+
+    except (OSError, ValueError, sqlite3.Error, pd.errors.DatabaseError) as e:
+        print('Error! '+str(e), file=sys.stderr)
+        return(1)
+
+    return(0)
+
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,136 @@
+"""
+Organism and contaminant rule sets used to clean the identified proteins.
+
+A rule set (profile) is read from rules.json (or any json file with the same structure) :
+    "profile name" : {
+        "description" : free text,
+        "target" : name of the organism kept, used in the printed summary,
+        "contaminants" : cRAP-like list of accessions always removed (P00761, ...),
+        "drop" : {"label" : [patterns]} accessions removed and counted under "label",
+        "drop_species" : {"label" : [taxonomy suffixes]} same, matched on the _SPECIES suffix,
+        "keep" : [patterns] accessions of the target organism,
+        "keep_species" : [taxonomy suffixes] same, matched on the _SPECIES suffix
+    }
+
+Rules are checked in this order : contaminants, drop, drop_species, keep, keep_species.
+The first matching rule gives the label of the accession, accessions matching nothing are "other" and removed.
+Patterns are regular expressions (a plain word such as HUMAN is matched anywhere in the accession).
+
+Every rule of a profile is compiled in a single regex, so the whole 'accession' column
+is classified in one vectorized call whatever the number of organisms / contaminants.
+"""
+
+import json
+import os
+import re
+from functools import lru_cache
+
+import numpy as np
+import pandas as pd
+
+
+RULES_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'rules.json')
+DEFAULT_PROFILE = 'myc'
+
+# label given to the accessions of the organism of interest
+TARGET = 'target'
+OTHER = 'other'
+CONTAMINANT = 'contaminant'
+
+
+
+def load_profiles(path=None):
+    # read every profile of a rules file, return a dict { 'profile name' : profile }
+    with open(path or RULES_PATH, encoding='utf-8') as f:
+        profiles = json.load(f)
+
+    if not isinstance(profiles, dict) or not profiles:
+        raise ValueError('No rule set found in '+str(path or RULES_PATH)+'.')
+    return(profiles)
+
+
+
+def _word(accession):
+    # an accession from the contaminant list, not glued to other letters / digits
+    return('(?<![A-Za-z0-9])'+re.escape(accession)+'(?![A-Za-z0-9])')
+
+
+def _species(suffixes):
+    # taxonomy suffix : PROT_SPECIES, at the end of the accession or before a separator
+    return('_(?:'+'|'.join(re.escape(s) for s in suffixes)+')(?![A-Za-z0-9])')
+
+
+def compile_rules(profile):
+    '''
+    compile a profile in a single anchored regex
+    each rule is a lookahead branch with its own empty named group, branches are tried in
+    priority order, the group that matched gives the label
+    returns a dict with the compiled pattern, the label of each group and the target's name
+    '''
+    branches = [] # [(label, regex)]
+
+    if profile.get('contaminants'):
+        branches.append((CONTAMINANT, '|'.join(_word(a) for a in profile['contaminants'])))
+
+    for label, patterns in profile.get('drop', {}).items():
+        if patterns:
+            branches.append((label, '|'.join('(?:'+p+')' for p in patterns)))
+
+    for label, suffixes in profile.get('drop_species', {}).items():
+        if suffixes:
+            branches.append((label, _species(suffixes)))
+
+    if profile.get('keep'):
+        branches.append((TARGET, '|'.join('(?:'+p+')' for p in profile['keep'])))
+
+    if profile.get('keep_species'):
+        branches.append((TARGET, _species(profile['keep_species'])))
+
+    if not any(label == TARGET for label, regex in branches):
+        raise ValueError('The rule set has no "keep" nor "keep_species" rule : every protein would be removed.')
+
+    groups = {}
+    regex = []
+    for i, (label, pattern) in enumerate(branches):
+        groups['r'+str(i)] = label
+        regex.append('(?=.*?(?:'+pattern+'))(?P<r'+str(i)+'>)')
+
+    rules = {
+        'pattern' : re.compile('^(?:'+'|'.join(regex)+')', re.DOTALL),
+        'groups' : groups,
+        'labels' : list(dict.fromkeys(groups.values())),
+        'target' : profile.get('target', 'target organism'),
+    }
+    return(rules)
+
+
+
+@lru_cache(maxsize=None)
+def get_rules(profile=DEFAULT_PROFILE, path=None):
+    # load and compile a named profile, compiled once per (profile, file)
+    profiles = load_profiles(path)
+    if profile not in profiles:
+        raise KeyError('Unknown rule set "'+str(profile)+'", available : '+', '.join(profiles)+'.')
+    return(compile_rules(profiles[profile]))
+
+
+
+def classify(accessions, rules):
+    # label every accession in one vectorized call, unmatched (and empty) accessions are 'other'
+    acc = pd.Series(accessions)
+    if isinstance(acc.dtype, pd.CategoricalDtype):
+        # each distinct accession used labelled once (the categories can be shared with other datasets,
+        # missing ones : code -1, the last 'other')
+        codes = acc.cat.codes.to_numpy()
+        used = np.unique(codes[codes >= 0])
+        labels = np.full(len(acc.cat.categories)+1, OTHER, dtype=object)
+        labels[used] = classify(acc.cat.categories[used].to_series(), rules)
+        return(labels[codes])
+
+    acc = acc.astype('string').fillna('')
+    matched = acc.str.extract(rules['pattern']).notna().to_numpy()
+
+    group_labels = np.array(list(rules['groups'].values()) + [OTHER], dtype=object)
+    # first matching group of each row, the extra column catches rows without any match
+    first = np.column_stack([matched, np.ones(len(acc), dtype=bool)]).argmax(axis=1)
+    return(group_labels[first])
@@ -0,0 +1,153 @@
+"""
+Cache of the analysis stages : contaminants / MW filter (by band), pull-down treatment, plots and written
+results (the overlaps between bands are built again, see pipeline_def.overlap_bands_cached).
+
+-> a stage result is saved under a key made of its input data (content hash) and its parameters :
+   after a change (a band's cut-off, a new band ...) only the stages depending on it are computed again,
+   the other ones are loaded
+-> the excel files being read are cached by ingest_def (sidecars), results files already written and
+   unchanged since are not written again
+-> results are pickled in a 'stages' folder of the '.proteocross_cache' folder. The least recently used
+   ones are deleted when the folder is larger than max_bytes.
+"""
+
+import hashlib
+import os
+import pickle
+
+import pandas as pd
+
+import ingest_def
+
+
+STAGES_FOLDER = 'stages'
+MAX_BYTES = 1 << 30 # 1 GB
+
+
+
+def data_hash(*parts):
+    # content hash of dataframes, bytes and any other value (by its repr)
+    h = hashlib.sha1()
+    for part in parts:
+        if isinstance(part, pd.DataFrame):
+            h.update(repr(list(part.columns)).encode('utf-8'))
+            h.update(pd.util.hash_pandas_object(part, index=False).to_numpy().tobytes())
+        elif isinstance(part, bytes):
+            h.update(part)
+        else:
+            h.update(repr(part).encode('utf-8'))
+        h.update(b'|')
+    return(h.hexdigest())
+
+
+def rules_key(rules):
+    # a compiled rule set (see rules_def.compile_rules) as a hashable description
+    return((rules['pattern'].pattern, tuple(rules['groups'].items()), rules['target']))
+
+
+
+class StageCache:
+    '''
+    results of the stages, pickled in folder (see this module's description)
+    next to data : StageCache.next_to(path of a data file)
+    '''
+
+    def __init__(self, folder, max_bytes=MAX_BYTES):
+        self.folder = folder
+        self.max_bytes = max_bytes
+
+
+    @classmethod
+    def next_to(cls, path, max_bytes=MAX_BYTES):
+        folder = os.path.join(os.path.dirname(os.path.abspath(path)), ingest_def.CACHE_FOLDER, STAGES_FOLDER)
+        return(cls(folder, max_bytes))
+
+
+    def path(self, stage, key):
+        return(os.path.join(self.folder, stage+'.'+key+'.pkl'))
+
+
+    def get(self, stage, key, default=None):
+        # saved result of a stage, default if there is none (the file is marked as recently used)
+        path = self.path(stage, key)
+        try:
+            with open(path, 'rb') as f:
+                value = pickle.load(f)
+            os.utime(path)
+            return(value)
+        except (OSError, EOFError, pickle.UnpicklingError, AttributeError, ImportError):
+            return(default)
+
+
+    def put(self, stage, key, value):
+        # the cache is only a speed-up : a result that cannot be saved is skipped
+        path = self.path(stage, key)
+        try:
+            os.makedirs(self.folder, exist_ok=True)
+            tmp = path+'.'+str(os.getpid())+'.tmp' # several processes can share the folder
+            with open(tmp, 'wb') as f:
+                pickle.dump(value, f, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(tmp, path)
+        except (OSError, pickle.PicklingError, TypeError):
+            return
+        self.evict()
+
+
+    def cached(self, stage, key, compute, *args):
+        '''
+        result of compute(*args), loaded if it was already computed under key
+        returns the result and whether it was loaded
+        '''
+        missing = object()
+        value = self.get(stage, key, missing)
+        if value is not missing:
+            return(value, True)
+        value = compute(*args)
+        self.put(stage, key, value)
+        return(value, False)
+
+
+    def evict(self):
+        # delete the least recently used results while the folder is larger than max_bytes
+        try:
+            entries = [e for e in os.scandir(self.folder) if e.name.endswith('.pkl')]
+        except OSError:
+            return
+        stats = [(e.stat().st_mtime, e.stat().st_size, e.path) for e in entries]
+        total = sum(size for _, size, _ in stats)
+        for _, size, path in sorted(stats):
+            if total <= self.max_bytes:
+                break
+            try:
+                os.remove(path)
+                total -= size
+            except OSError:
+                pass
+
+
+    def written(self, key):
+        # files written under key, if they are all still there and unchanged, else None
+        files = self.get('write', key)
+        if files is None:
+            return(None)
+        for path, size, mtime in files:
+            try:
+                stat = os.stat(path)
+            except OSError:
+                return(None)
+            if (stat.st_size, stat.st_mtime_ns) != (size, mtime):
+                return(None)
+        return([path for path, _, _ in files])
+
+
+    def mark_written(self, key, paths):
+        files = []
+        for path in paths:
+            stat = os.stat(path)
+            files.append((path, stat.st_size, stat.st_mtime_ns))
+        self.put('write', key, files)
+
+
+    def clear(self):
+        # delete every saved result, return how many were deleted
+        return(ingest_def.remove_folder(self.folder))
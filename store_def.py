@@ -0,0 +1,296 @@
+"""
+Results store : every run's clean bands, pull-downs, overlaps and parameters in one local SQLite database,
+so that past experiments can be searched without opening their excel files.
+
+-> tables (one row per protein identification, indexed by protein, run and band / pull-down) :
+   runs : run_id, name, date, output folder, match level, parameters (json of the manifest), run_key
+   bands : run_id, band, MW cut-offs, proteins kept
+   band_proteins : run_id, band, protein, accession, gene_name, description, MW, protein_set_score, coverage,
+                   match_id (canonical ID at the match level of the run, the ID the bands were crossed on)
+   band_pairs : run_id, band_a, band_b, shared (number of proteins in both bands, see pipeline_def.pair_counts)
+   pulldowns : run_id, pulldown, significance (min_ratio, max_pvalue, correction), proteins, enriched
+   pulldown_proteins : run_id, pulldown, protein, accession, gene_name, description, MW, ratio, p_value, q_value,
+                       log2_ratio, log10_p, enriched (1 / 0)
+-> 'protein' is the canonical ID of the accession (see accession_def, 'protein' level) : a protein is found
+   whatever the way its accession was written in each run, or by its gene name (any case, see find)
+-> ResultsStore.find / runs / shared / query answer from the indexes, see proteostore.py for the command line
+-> the proteins shared by two bands (overlaps) are not saved twice : ResultsStore.shared joins band_proteins
+   on match_id (SHARED_QUERY)
+-> run_key : hash of the parameters and of the content of the input files (see run_key). Saving the same run
+   again replaces it by default (duplicates : 'replace', 'skip' to keep the saved one, 'keep' to add it anyway)
+
+sqlite3 is part of python : nothing to install. Several processes can save runs in the same file (each run is
+saved in one transaction, the others wait for it).
+"""
+
+import hashlib
+import json
+import os
+import sqlite3
+from datetime import datetime
+
+import pandas as pd
+
+import accession_def
+import ingest_def
+import pipeline_def
+
+
+TIMEOUT = 60 # seconds waiting for another process saving a run
+DUPLICATES = ('replace', 'skip', 'keep') # what to do when a run with the same run_key is saved again
+# parameters without effect on what is saved, left out of run_key
+OUTPUT_PARAMS = ('name', 'store', 'store_duplicates', 'format', 'chunksize', 'volcanoes')
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS runs (run_id INTEGER PRIMARY KEY, name TEXT, date TEXT, output TEXT, match TEXT,
+                                 params TEXT, run_key TEXT);
+CREATE TABLE IF NOT EXISTS bands (run_id INTEGER, band TEXT, min_mw REAL, max_mw REAL, proteins INTEGER);
+CREATE TABLE IF NOT EXISTS band_proteins (run_id INTEGER, band TEXT, protein TEXT, accession TEXT, gene_name TEXT,
+                                          description TEXT, MW REAL, protein_set_score REAL, coverage REAL,
+                                          match_id TEXT);
+CREATE TABLE IF NOT EXISTS band_pairs (run_id INTEGER, band_a TEXT, band_b TEXT, shared INTEGER);
+CREATE TABLE IF NOT EXISTS pulldowns (run_id INTEGER, pulldown TEXT, min_ratio REAL, max_pvalue REAL, correction TEXT,
+                                      proteins INTEGER, enriched INTEGER);
+CREATE TABLE IF NOT EXISTS pulldown_proteins (run_id INTEGER, pulldown TEXT, protein TEXT, accession TEXT,
+                                              gene_name TEXT, description TEXT, MW REAL, ratio REAL, p_value REAL,
+                                              q_value REAL, log2_ratio REAL, log10_p REAL, enriched INTEGER);
+CREATE INDEX IF NOT EXISTS band_proteins_protein ON band_proteins (protein);
+CREATE INDEX IF NOT EXISTS band_proteins_run ON band_proteins (run_id, band);
+CREATE INDEX IF NOT EXISTS pulldown_proteins_protein ON pulldown_proteins (protein, enriched);
+CREATE INDEX IF NOT EXISTS pulldown_proteins_run ON pulldown_proteins (run_id, pulldown);
+CREATE INDEX IF NOT EXISTS bands_run ON bands (run_id);
+CREATE INDEX IF NOT EXISTS band_pairs_run ON band_pairs (run_id);
+CREATE INDEX IF NOT EXISTS pulldowns_run ON pulldowns (run_id);
+CREATE INDEX IF NOT EXISTS band_proteins_gene ON band_proteins (gene_name COLLATE NOCASE);
+CREATE INDEX IF NOT EXISTS pulldown_proteins_gene ON pulldown_proteins (gene_name COLLATE NOCASE);
+'''
+# proteins (canonical IDs) searched by find : the ID of the accession given, and the proteins of that gene name
+FIND_IDS = '''
+SELECT ? UNION SELECT protein FROM band_proteins WHERE gene_name = ? COLLATE NOCASE
+UNION SELECT protein FROM pulldown_proteins WHERE gene_name = ? COLLATE NOCASE
+'''
+# columns added since the first stores (added when an older store is opened), then their indexes
+NEW_COLUMNS = {'runs' : [('run_key', 'TEXT')], 'band_proteins' : [('match_id', 'TEXT')]}
+NEW_INDEXES = '''
+CREATE INDEX IF NOT EXISTS runs_key ON runs (run_key);
+CREATE INDEX IF NOT EXISTS band_proteins_match ON band_proteins (run_id, match_id);
+'''
+# proteins of a run in both bands, as the bands were crossed (match_id ; protein for the runs saved before it)
+SHARED_QUERY = '''
+SELECT DISTINCT COALESCE(a.match_id, a.protein) AS id, a.accession AS accession_a, b.accession AS accession_b,
+       a.gene_name, a.description, a.MW
+FROM band_proteins a JOIN band_proteins b
+     ON b.run_id = a.run_id AND COALESCE(b.match_id, b.protein) = COALESCE(a.match_id, a.protein)
+WHERE a.run_id = ? AND a.band = ? AND b.band = ?
+ORDER BY id
+'''
+TABLES = ('band_pairs', 'band_proteins', 'bands', 'pulldown_proteins', 'pulldowns', 'runs')
+
+# store column : column of the clean bands / treated pull-downs
+BAND_COLUMNS = {'accession' : 'accession', 'gene_name' : 'gene_name', 'description' : 'description', 'MW' : 'MW',
+                'protein_set_score' : 'protein_set_score', 'coverage' : 'coverage'}
+PULLDOWN_COLUMNS = {'accession' : 'accession', 'gene_name' : 'gene_name', 'description' : 'description', 'MW' : 'MW',
+                    'ratio' : 'ratio_g1_vs_g2', 'p_value' : 't_test_g1_vs_g2', 'q_value' : 'q_value_BH',
+                    'log2_ratio' : 'Ratio_Log2', 'log10_p' : 'T_test_Log10'}
+NUMBER_COLUMNS = {'MW', 'protein_set_score', 'coverage', 'ratio', 'p_value', 'q_value', 'log2_ratio', 'log10_p'}
+
+
+
+def _values(df, column, number):
+    # a column as python values for sqlite (missing : None), a column of None if df has no such column
+    if column not in df.columns:
+        return([None]*len(df))
+    if number:
+        # NaN are saved as NULL by sqlite
+        return(pd.to_numeric(df[column], errors='coerce').to_numpy(dtype=float).tolist())
+    values = df[column].astype(object)
+    return(values.where(values.notna(), None).astype(object).tolist())
+
+
+def run_key(params, files, *parts):
+    '''
+    what makes two runs the same : their parameters (json-able, the manifest, without OUTPUT_PARAMS),
+    the content of their input files and any other parts (the rules, see stage_cache_def.rules_key)
+    '''
+    h = hashlib.sha1()
+    params = {k : v for k, v in (params or {}).items() if k not in OUTPUT_PARAMS}
+    h.update(json.dumps(params, sort_keys=True, default=str).encode('utf-8'))
+    for path in files:
+        h.update(ingest_def.file_hash(path).encode('utf-8'))
+    for part in parts:
+        h.update(repr(part).encode('utf-8'))
+    return(h.hexdigest())
+
+
+
+def check_duplicates(duplicates):
+    if duplicates not in DUPLICATES:
+        raise ValueError('Unknown duplicates "'+str(duplicates)+'" ('+', '.join(DUPLICATES)+').')
+    return(duplicates)
+
+
+
+def _ids(df, match):
+    ids = accession_def.canonical(df['accession'], match)
+    return(ids.where(ids.notna(), None).astype(object).tolist())
+
+
+def protein_rows(run_id, name, df, columns, match=None):
+    '''
+    one tuple per row of df : run_id, band / pull-down name, protein (canonical ID), then the store columns,
+    then with match the canonical ID at that level (match_id)
+    '''
+    cols = [[run_id]*len(df), [name]*len(df), _ids(df, 'protein')]
+    cols += [_values(df, column, store_column in NUMBER_COLUMNS) for store_column, column in columns.items()]
+    if match is not None:
+        cols.append(_ids(df, match))
+    return(list(zip(*cols)))
+
+
+
+class ResultsStore:
+    '''
+    results of every run in a SQLite file (see this module's description)
+    store = ResultsStore('results.sqlite') ; store.add_run(...) ; store.find('P9WGR1')
+    '''
+
+    def __init__(self, path):
+        self.path = path
+        con = self.connect()
+        try:
+            con.executescript(SCHEMA)
+            for table, columns in NEW_COLUMNS.items():
+                present = [row[1] for row in con.execute('PRAGMA table_info('+table+')')]
+                for column, kind in columns:
+                    if column not in present:
+                        con.execute('ALTER TABLE '+table+' ADD COLUMN '+column+' '+kind)
+            con.executescript(NEW_INDEXES)
+        finally:
+            con.close()
+
+
+    def connect(self):
+        folder = os.path.dirname(os.path.abspath(self.path))
+        os.makedirs(folder, exist_ok=True)
+        con = sqlite3.connect(self.path, timeout=TIMEOUT)
+        con.execute('PRAGMA journal_mode=WAL') # readers do not wait for a run being saved
+        return(con)
+
+
+    def add_run(self, name, clean_df, pulldowns=None, params=None, output=None, bands_mw=None,
+                match=accession_def.DEFAULT_MATCH, key=None, duplicates='replace'):
+        '''
+        save a run, returns its run_id (with 'skip', the run_id of the run already saved)
+        clean_df : clean bands (list of dataframes with a name), bands_mw : { band : (min MW, max MW) }
+        pulldowns : { name : (treated pull-down, min_ratio, max_pvalue, correction) }, the treated pull-down as
+        returned by pipeline_def.process_pulldown (its 'enriched' column, or the significance, tells the enriched rows)
+        params : parameters of the run (json-able, the manifest), match : how the bands were matched (band_pairs)
+        key : run_key of the run, duplicates : what to do if a run with the same key is saved (see DUPLICATES)
+        '''
+        check_duplicates(duplicates)
+        pulldowns = pulldowns or {}
+        bands_mw = bands_mw or {}
+        counts = pipeline_def.pair_counts(pipeline_def.presence_matrix(clean_df, match))
+
+        con = self.connect()
+        try:
+            with con:
+                same = []
+                if key is not None and duplicates != 'keep':
+                    same = [row[0] for row in con.execute('SELECT run_id FROM runs WHERE run_key = ? ORDER BY run_id',
+                                                          (key,))]
+                if same and duplicates == 'skip':
+                    return(same[-1])
+                for old in same:
+                    self._delete(con, old)
+
+                run_id = con.execute('INSERT INTO runs (name, date, output, match, params, run_key) '
+                                     'VALUES (?, ?, ?, ?, ?, ?)',
+                                     (name, datetime.now().isoformat(timespec='seconds'), output, match,
+                                      json.dumps(params or {}, default=str), key)).lastrowid
+
+                for df in clean_df:
+                    MWmin, MWmax = bands_mw.get(df.name, (None, None))
+                    con.execute('INSERT INTO bands VALUES (?, ?, ?, ?, ?)', (run_id, df.name, MWmin, MWmax, len(df)))
+                    con.executemany('INSERT INTO band_proteins (run_id, band, protein, '+', '.join(BAND_COLUMNS)+
+                                    ', match_id) VALUES ('+', '.join(['?']*(len(BAND_COLUMNS)+4))+')',
+                                    protein_rows(run_id, df.name, df, BAND_COLUMNS, match))
+                con.executemany('INSERT INTO band_pairs VALUES (?, ?, ?, ?)',
+                                [(run_id, a, b, int(counts.loc[a, b])) for i, a in enumerate(counts.index)
+                                 for b in counts.columns[i+1:]])
+
+                for pulldown, (df, min_ratio, max_pvalue, correction) in pulldowns.items():
+                    if 'enriched' in df.columns:
+                        enriched = df['enriched'].to_numpy(dtype=bool)
+                    else:
+                        enriched = pipeline_def.significant_mask(df, min_ratio, max_pvalue, correction)
+                    con.execute('INSERT INTO pulldowns VALUES (?, ?, ?, ?, ?, ?, ?)',
+                                (run_id, pulldown, min_ratio, max_pvalue, correction, len(df), int(enriched.sum())))
+                    rows = protein_rows(run_id, pulldown, df, PULLDOWN_COLUMNS)
+                    con.executemany('INSERT INTO pulldown_proteins VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)',
+                                    [row + (int(e),) for row, e in zip(rows, enriched.tolist())])
+        finally:
+            con.close()
+        return(run_id)
+
+
+    def query(self, sql, params=()):
+        # any SELECT on the tables, as a dataframe
+        con = self.connect()
+        try:
+            return(pd.read_sql_query(sql, con, params=params))
+        finally:
+            con.close()
+
+
+    def runs(self):
+        # every run saved, with its number of bands and pull-downs, latest first
+        return(self.query('SELECT r.run_id, r.name, r.date, r.output, r.match, '
+                          '(SELECT COUNT(*) FROM bands b WHERE b.run_id = r.run_id) AS bands, '
+                          '(SELECT COUNT(*) FROM pulldowns p WHERE p.run_id = r.run_id) AS pulldowns '
+                          'FROM runs r ORDER BY r.run_id DESC'))
+
+
+    def find(self, accession, enriched=False):
+        '''
+        where was a protein found : any written form of its accession (see accession_def) or its gene name
+        (any case ; entry names such as CLPB_MYCTU are not searched)
+        returns {'bands' : its rows in the clean bands of every run, 'pulldowns' : its rows in every pull-down}
+        enriched : only the pull-downs where it was enriched (and no bands)
+        '''
+        protein = accession_def.canonical([accession], 'protein')[0]
+        ids = (protein, accession.strip(), accession.strip())
+        pulldowns = self.query('SELECT r.run_id, r.name AS run, r.date, p.pulldown, p.accession, p.gene_name, p.ratio, '
+                               'p.p_value, p.q_value, p.enriched FROM pulldown_proteins p JOIN runs r USING (run_id) '
+                               'WHERE p.protein IN ('+FIND_IDS+')'+(' AND p.enriched = 1' if enriched else '')+
+                               ' ORDER BY r.run_id, p.pulldown', ids)
+        if enriched:
+            return({'bands' : None, 'pulldowns' : pulldowns})
+        bands = self.query('SELECT r.run_id, r.name AS run, r.date, b.band, b.accession, b.gene_name, b.MW, '
+                           'b.protein_set_score, b.coverage FROM band_proteins b JOIN runs r USING (run_id) '
+                           'WHERE b.protein IN ('+FIND_IDS+') ORDER BY r.run_id, b.band', ids)
+        return({'bands' : bands, 'pulldowns' : pulldowns})
+
+
+    @staticmethod
+    def _delete(con, run_id):
+        # delete a run and all its rows in an open transaction, returns whether it existed
+        deleted = con.execute('DELETE FROM runs WHERE run_id = ?', (run_id,)).rowcount
+        for table in TABLES[:-1]:
+            con.execute('DELETE FROM '+table+' WHERE run_id = ?', (run_id,))
+        return(bool(deleted))
+
+
+    def shared(self, run_id, band_a, band_b):
+        # proteins of a run found in both bands (the rows of 'common band_a band_b'), one row per pair of accessions
+        return(self.query(SHARED_QUERY, (run_id, band_a, band_b)))
+
+
+    def delete_run(self, run_id):
+        # delete a run and all its rows, returns whether it existed
+        con = self.connect()
+        try:
+            with con:
+                deleted = self._delete(con, run_id)
+        finally:
+            con.close()
+        return(deleted)
@@ -0,0 +1,130 @@
+"""
+Synthetic "Protein sets" sheets, to benchmark the pipeline without real data (see benchmark.py).
+
+-> accessions in the UniProt style (sp|P12345|G00042_MYCTU) drawn from one proteome shared by all the bands,
+   so that bands overlap, with a given species mix and a fraction of duplicated accessions
+   (every protein of a proteome has its own accession : distinct proteins never match, see accession_def)
+-> molecular weights (Dalton) drawn from a log-normal distribution, as in a whole proteome (median and sigma
+   can be changed, see proteome)
+-> a pull-down adds the 'ratio_g1_vs_g2' and 't-test_g1_vs_g2' columns : mostly unchanged proteins,
+   a fraction of enriched ones, and a few ratio / t-test of exactly 0 (see pipeline_def.volcano_transform)
+"""
+
+import numpy as np
+import pandas as pd
+
+
+# species suffixes and their share of the identifications (matches the profiles of rules.json)
+SPECIES_MIX = {'MYCTU' : 0.55, 'MYCBO' : 0.05, 'HUMAN' : 0.15, 'MOUSE' : 0.1, 'BOVIN' : 0.05, 'ECOLI' : 0.1}
+MW_MEDIAN = 40000 # Dalton
+MW_SIGMA = 0.6 # of log(MW)
+MW_RANGE = (5000, 500000)
+# UniProt accessions of 6 characters : [OPQ][0-9][A-Z0-9]{3}[0-9]
+ALNUM = '0123456789ABCDEFGHIJKLMNOPQRSTUVWXYZ'
+ACCESSIONS = 3 * 10 * 36**3 * 10
+
+
+
+def uniprot_accession(i):
+    # the i-th accession (0 <= i < ACCESSIONS) of the 6 characters UniProt format
+    i, last = divmod(i, 10)
+    i, middle = divmod(i, 36**3)
+    first, digit = divmod(i, 10)
+    middle = ALNUM[middle // 36**2]+ALNUM[middle // 36 % 36]+ALNUM[middle % 36]
+    return('OPQ'[first]+str(digit)+middle+str(last))
+
+
+
+def proteome(size, species=SPECIES_MIX, seed=0, mw_median=MW_MEDIAN, mw_sigma=MW_SIGMA):
+    '''
+    accessions and molecular weights of size proteins, each with its own accession
+    species : {species suffix : share of the proteins}
+    mw_median (Dalton) / mw_sigma (of log(MW)) : log-normal distribution of the MW, clipped to MW_RANGE
+    '''
+    if size > ACCESSIONS:
+        raise ValueError('At most '+str(ACCESSIONS)+' proteins in a synthetic proteome.')
+    rng = np.random.default_rng(seed)
+    names = list(species)
+    shares = np.array([species[s] for s in names], dtype=float)
+    species_of = rng.choice(len(names), size, p=shares/shares.sum())
+
+    ids = rng.choice(ACCESSIONS, size, replace=False)
+    accession = ['sp|'+uniprot_accession(i)+'|G'+format(n, '05d')+'_'+names[s]
+                 for n, (i, s) in enumerate(zip(ids.tolist(), species_of))]
+    mw = np.clip(rng.lognormal(np.log(mw_median), mw_sigma, size), *MW_RANGE).round()
+    return(pd.DataFrame({'accession' : accession, 'gene_name' : ['G'+format(n, '05d') for n in range(size)],
+                         'MW' : mw}))
+
+
+
+def protein_sets(rows, proteins=None, duplicates=0.02, pulldown=False, enriched=0.1, mw_window=None, seed=0):
+    '''
+    a synthetic "Protein sets" sheet of rows identifications
+    proteins : proteome to draw from (see proteome, default : 2 x rows proteins)
+    mw_window : (min, max) of a gel band, its proteins are 10 times more likely to be drawn
+    duplicates : fraction of rows repeating the accession of another row
+    pulldown : add the ratio and t-test columns, enriched : fraction of enriched proteins
+    '''
+    rng = np.random.default_rng(seed)
+    if proteins is None:
+        proteins = proteome(2*rows, seed=seed)
+
+    unique = rows - int(rows*duplicates)
+    weights = None
+    if mw_window is not None:
+        mw = proteins['MW'].to_numpy()
+        weights = np.where((mw >= mw_window[0]) & (mw <= mw_window[1]), 1, 0.1)
+        weights = weights/weights.sum()
+    picked = rng.choice(len(proteins), unique, replace=unique > len(proteins), p=weights)
+    picked = np.concatenate([picked, rng.choice(picked, rows-unique)]) if unique else picked
+    df = proteins.iloc[picked].reset_index(drop=True)
+
+    df.insert(2, 'description', 'Protein '+df['gene_name']+' OS=synthetic OX=0 GN='+df['gene_name'])
+    df.insert(3, 'protein_set_score', rng.gamma(2, 40, rows).round(2))
+    df.insert(4, 'coverage', rng.uniform(1, 80, rows).round(1))
+
+    if pulldown:
+        up = rng.random(rows) < enriched
+        ratio = np.where(up, rng.lognormal(np.log(6), 0.8, rows), rng.lognormal(0, 0.7, rows))
+        ttest = np.where(up, rng.beta(1, 40, rows), rng.uniform(0, 1, rows))
+        # some exact zeros, as exported by the software
+        ratio[rng.random(rows) < 0.002] = 0
+        ttest[rng.random(rows) < 0.002] = 0
+        df['ratio_g1_vs_g2'] = ratio
+        df['t-test_g1_vs_g2'] = ttest
+
+    return(df)
+
+
+
+def bands_dict(n_bands, rows, proteins=None, duplicates=0.02, seed=0):
+    '''
+    n_bands bands of rows identifications from the same proteome, as used by pipeline_def.filter_bands :
+    {'B1' : [dataframe, minimal MW, maximal MW]}, the MW windows of the bands overlap and cover the proteome
+    '''
+    if proteins is None:
+        proteins = proteome(2*rows, seed=seed)
+    edges = np.geomspace(MW_RANGE[0], MW_RANGE[1], n_bands+1)
+
+    bands = {}
+    for i in range(n_bands):
+        name = 'B'+str(i+1)
+        window = (float(edges[i]*0.8), float(edges[i+1]*1.2))
+        df = protein_sets(rows, proteins, duplicates, mw_window=window, seed=seed+i+1)
+        df.name = name
+        bands[name] = [df] + list(window)
+    return(bands)
+
+
+
+def pulldown(rows, proteins=None, duplicates=0.02, enriched=0.1, seed=0):
+    # a synthetic pull-down, from the proteome of the bands to cross it with them
+    return(protein_sets(rows, proteins, duplicates, pulldown=True, enriched=enriched, seed=seed+1000))
+
+
+
+def write_protein_sets(df, path, sheet_name='Protein sets'):
+    # save a synthetic sheet as the identification software does
+    with pd.ExcelWriter(path) as writer:
+        df.to_excel(writer, sheet_name=sheet_name, index=False)
+    return(path)
@@ -0,0 +1,122 @@
+"""
+Result tables displayed in the app : a Treeview of fixed height over a dataframe.
+
+-> only the rows scrolled to are inserted in the Treeview, by chunks (each insert is a Tk call)
+-> sorting (click on a column header) and search are done in pandas, then the first chunk is reloaded
+"""
+
+import tkinter as tk
+from tkinter import ttk
+
+import pandas as pd
+
+
+HEIGHT = 15 # visible rows
+CHUNK = 100 # rows inserted at once
+COLUMN_WIDTHS = {'Accession' : 100, 'Description' : 400, 'Coverage' : 60, 'MW' : 55}
+
+
+
+def search_index(df):
+    # one lower case string per row (all the columns), searched by filter_rows
+    text = pd.Series('', index=df.index)
+    for c in df.columns:
+        text = text + '\t' + df[c].astype(str).str.lower()
+    return(text)
+
+
+def filter_rows(df, index, query):
+    # rows containing query (case insensitive) in any column
+    query = query.strip().lower()
+    if not query:
+        return(df)
+    return(df[index.str.contains(query, regex=False).to_numpy()])
+
+
+def sort_rows(df, column, ascending=True):
+    # stable sort, missing values last
+    return(df.sort_values(column, ascending=ascending, kind='mergesort', na_position='last'))
+
+
+
+class DataTable(tk.Frame):
+    '''
+    dataframe displayed in a Treeview of height rows, with a scrollbar, a search entry and sortable columns
+    rows are inserted chunk rows at a time, when the scroll reaches the end of the inserted rows
+    '''
+
+    def __init__(self, parent, df, height=HEIGHT, chunk=CHUNK, widths=COLUMN_WIDTHS, **kwargs):
+        super().__init__(parent, **kwargs)
+        self.df = df
+        self.index = search_index(df)
+        self.view = df # rows displayed (filtered and sorted)
+        self.chunk = chunk
+        self.loaded = 0 # rows of view inserted in the Treeview
+        self.sorted_by = None # (column, ascending)
+
+        top = tk.Frame(self)
+        top.pack(fill='x')
+        tk.Label(top, text='Search :').pack(side='left')
+        self.query = tk.StringVar()
+        self.query.trace_add('write', lambda *args: self.search())
+        tk.Entry(top, textvariable=self.query, width=30).pack(side='left')
+        self.count = tk.StringVar()
+        tk.Label(top, textvariable=self.count).pack(side='right')
+
+        columns = list(df.columns.values)
+        self.tree = ttk.Treeview(self, columns=columns, height=min(height, max(len(df), 1)), show='headings')
+        for c in columns:
+            self.tree.column(c, width=widths.get(c, 85), anchor='c')
+            self.tree.heading(c, text=str(c).replace('_', ' '), command=lambda c=c: self.sort(c))
+
+        self.scrollbar = ttk.Scrollbar(self, orient='vertical', command=self.tree.yview)
+        self.tree.configure(yscrollcommand=self.on_scroll)
+        self.tree.pack(side='left')
+        self.scrollbar.pack(side='right', fill='y')
+
+        self.reload()
+
+
+    def load_more(self):
+        # insert the next chunk of rows
+        rows = self.view.iloc[self.loaded:self.loaded+self.chunk].to_numpy().tolist()
+        for row in rows:
+            self.tree.insert('', 'end', values=row)
+        self.loaded += len(rows)
+
+
+    def on_scroll(self, first, last):
+        self.scrollbar.set(first, last)
+        # end of the inserted rows visible : insert the next ones
+        if float(last) >= 0.9 and self.loaded < len(self.view):
+            self.load_more()
+
+
+    def reload(self):
+        # display view again from its first rows
+        children = self.tree.get_children()
+        if children:
+            self.tree.delete(*children)
+        self.loaded = 0
+        self.load_more()
+        self.count.set(str(len(self.view))+' / '+str(len(self.df))+' rows')
+
+
+    def refresh(self):
+        # apply the search then the sort to the whole dataframe
+        view = filter_rows(self.df, self.index, self.query.get())
+        if self.sorted_by is not None:
+            view = sort_rows(view, *self.sorted_by)
+        self.view = view
+        self.reload()
+
+
+    def search(self):
+        self.refresh()
+
+
+    def sort(self, column):
+        # first click : ascending, next clicks on the same column : reversed
+        ascending = not (self.sorted_by is not None and self.sorted_by == (column, True))
+        self.sorted_by = (column, ascending)
+        self.refresh()
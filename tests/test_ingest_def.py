@@ -0,0 +1,33 @@
+import pandas as pd
+import pytest
+
+import ingest_def
+import pipeline_def
+import synthetic_def
+
+
+def write_bands(folder, extra=None):
+    # two synthetic bands saved as csv, with an extra column not used by the treatment
+    bands = []
+    for name, (df, MWmin, MWmax) in synthetic_def.bands_dict(2, 300, synthetic_def.proteome(600)).items():
+        if extra:
+            df = df.assign(**{extra : range(len(df))})
+        path = folder / (name+'.csv')
+        df.to_csv(path, index=False)
+        bands.append({'name' : name, 'file' : str(path), 'min' : MWmin, 'max' : MWmax})
+    return(bands)
+
+
+def test_compact_keeps_every_column():
+    df = pd.DataFrame({'accession' : ['A', 'B'], 'MW' : [1000, 2000], 'peptides' : [3, 4]})
+    assert list(ingest_def.compact([df])[0].columns) == ['accession', 'MW', 'peptides']
+
+
+@pytest.mark.parametrize('chunksize', [None, 50])
+def test_extra_column_is_written(tmp_path, chunksize):
+    bands = write_bands(tmp_path, extra='peptides')
+    res = pipeline_def.run_band_files(bands, str(tmp_path), workers=1, cache=False, chunksize=chunksize)
+
+    written = pd.read_excel(tmp_path / 'Bands analysis results.xlsx', sheet_name=None)
+    assert 'peptides' in written['B1'].columns
+    assert written['B1']['peptides'].tolist() == res['clean_df'][0]['peptides'].tolist()
@@ -0,0 +1,46 @@
+from contextlib import contextmanager
+
+import numpy as np
+
+import pipeline_def
+import stage_cache_def
+import synthetic_def
+
+
+def run_pulldown(folder, stages):
+    # a synthetic pull-down crossed with two bands, with a threshold sweep and batch volcanoes, returns the records
+    proteins = synthetic_def.proteome(800)
+    bands_dict = synthetic_def.bands_dict(2, 300, proteins)
+    bands_dict, whole_pulld = pipeline_def.compact_datasets(bands_dict, synthetic_def.pulldown(400, proteins))
+    clean_df = pipeline_def.filter_bands(bands_dict)[0]
+
+    records = {}
+    @contextmanager
+    def step(name):
+        records[name] = {'stage' : name}
+        yield records[name]
+
+    pipeline_def.run_pulldown(whole_pulld, clean_df, str(folder), thresholds=[(4, 0.01)], volcanoes={'top' : [5]},
+                              stages=stages, step=step)
+    return(records)
+
+
+def test_unchanged_rerun_is_cached(tmp_path):
+    stages = stage_cache_def.StageCache(str(tmp_path / 'stages'))
+    first = run_pulldown(tmp_path, stages)
+    second = run_pulldown(tmp_path, stages)
+
+    for stage in ('pulldown', 'write pulldown', 'plot', 'threshold sweep', 'volcanoes'):
+        assert not first[stage]['cached']
+        assert second[stage]['cached'], stage
+
+
+def test_filter_bands_keeps_the_columns_of_each_band():
+    # a column of one band only is not added to the others, integer columns stay integers
+    bands_dict = synthetic_def.bands_dict(2, 300, synthetic_def.proteome(600))
+    bands_dict['B1'][0] = bands_dict['B1'][0].assign(peptides=np.arange(300, dtype='int64'))
+
+    clean_df = pipeline_def.filter_bands(bands_dict)[0]
+    assert clean_df[0]['peptides'].dtype == 'int64'
+    assert 'peptides' not in clean_df[1].columns
+    assert list(clean_df[1].columns) == list(bands_dict['B2'][0].columns)
@@ -0,0 +1,16 @@
+import numpy as np
+
+import profiling_def
+
+
+def test_peak_memory_is_per_stage():
+    # a small stage after a large one reports its own peak, not the largest one since the start
+    with profiling_def.measure('large') as large:
+        data = np.ones(40_000_000)
+        del data
+    with profiling_def.measure('small') as small:
+        data = np.ones(10)
+
+    if large['peak_rss_mb'] is None:
+        return # the OS does not give the memory used
+    assert large['peak_rss_mb'] - small['peak_rss_mb'] > 200
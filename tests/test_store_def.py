@@ -0,0 +1,60 @@
+import sqlite3
+
+import pipeline_def
+import store_def
+import synthetic_def
+
+
+def clean_bands():
+    bands_dict = synthetic_def.bands_dict(2, 200, synthetic_def.proteome(400))
+    return(pipeline_def.filter_bands(pipeline_def.compact_datasets(bands_dict)[0])[0])
+
+
+def test_same_run_saved_again(tmp_path):
+    store = store_def.ResultsStore(str(tmp_path / 'results.sqlite'))
+    clean_df = clean_bands()
+    add = lambda duplicates : store.add_run('run', clean_df, key='k', duplicates=duplicates)
+
+    first = add('replace')
+    second = add('replace')
+    assert len(store.runs()) == 1
+    assert store.query('SELECT COUNT(DISTINCT run_id) AS n FROM band_proteins')['n'][0] == 1
+    assert add('skip') == second
+    assert add('keep') != second
+    assert len(store.runs()) == 2
+
+
+def test_store_saved_before_run_key(tmp_path):
+    path = str(tmp_path / 'old.sqlite')
+    con = sqlite3.connect(path)
+    con.execute('CREATE TABLE runs (run_id INTEGER PRIMARY KEY, name TEXT, date TEXT, output TEXT, match TEXT, params TEXT)')
+    con.commit()
+    con.close()
+
+    store = store_def.ResultsStore(path)
+    store.add_run('run', clean_bands(), key='k')
+    store.add_run('run', clean_bands(), key='k')
+    assert len(store.runs()) == 1
+
+
+def test_shared_proteins_of_two_bands(tmp_path):
+    store = store_def.ResultsStore(str(tmp_path / 'results.sqlite'))
+    clean_df = clean_bands()
+    for match in ('protein', 'exact'):
+        run_id = store.add_run(match, clean_df, match=match)
+        shared = store.shared(run_id, 'B1', 'B2')
+        pairs = store.query('SELECT shared FROM band_pairs WHERE run_id = ?', (run_id,))
+        assert shared['id'].nunique() == pairs['shared'][0]
+
+
+def test_find_by_accession_or_gene_name(tmp_path):
+    store = store_def.ResultsStore(str(tmp_path / 'results.sqlite'))
+    clean_df = clean_bands()
+    store.add_run('run', clean_df)
+    row = clean_df[0].iloc[0]
+    accession = str(row['accession']).split('|')[1]
+
+    by_accession = store.find(accession)['bands']
+    by_gene = store.find(str(row['gene_name']).lower())['bands']
+    assert len(by_accession) > 0
+    assert by_gene.equals(by_accession)
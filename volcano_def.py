@@ -0,0 +1,229 @@
+"""
+Volcano plots of a pull-down (log2 ratio / -log10 t-test, see pipeline_def.volcano_transform).
+
+The axes (spines, grid, labels) are set once per pull-down, and the cloud of all the proteins
+is drawn only once as a raster image layer (points or a density hexbin). Every plot then only
+swaps its highlight points, threshold lines, title and legend on top of this layer.
+Plots are rendered in memory (bytes) : saved as files and displayed without reading them back.
+
+No pyplot : figures can be drawn from any thread.
+"""
+
+import colorsys
+import io
+import itertools
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+from matplotlib.figure import Figure
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+
+
+X = 'Ratio_Log2'
+Y = 'T_test_Log10'
+BACKGROUND_COLOR = '#5DADE2'
+BAND_COLORS = ['#8E44AD','#2ECC71','#ff3b58','#d5a0bb','#b87439','#1F618D']
+
+
+def band_colors(n):
+    # n colours for the bands : the usual six, then hues spread by the golden angle (never twice the same)
+    colors = BAND_COLORS[:n]
+    for i in range(n - len(colors)):
+        hue = (0.6 + i * 0.381966) % 1
+        r, g, b = colorsys.hls_to_rgb(hue, 0.5, 0.65)
+        colors.append('#%02x%02x%02x' % (round(r*255), round(g*255), round(b*255)))
+    return(colors)
+
+
+
+class Volcano:
+    '''
+    volcano plot template of a transformed pull-down
+    background : 'scatter' (every protein as a point) or 'hexbin' (density, for very large pull-downs)
+    '''
+
+    def __init__(self, pulldown_res, background='scatter', figsize=(6.4, 4.8), dpi=100):
+        self.x = pulldown_res[X].to_numpy(dtype=float)
+        self.y = pulldown_res[Y].to_numpy(dtype=float)
+        self.background = background
+        self.layers = {} # background images, by style
+        self.overlays = [] # artists of the current plot
+
+        self.fig = Figure(figsize=figsize, dpi=dpi)
+        FigureCanvasAgg(self.fig)
+        self.ax = self.fig.add_subplot()
+        ax = self.ax
+
+        # same limits as an autoscaled scatter of all the proteins
+        self.xlim = _limits(self.x)
+        self.ylim = _limits(self.y)
+        ax.set_xlim(self.xlim)
+        ax.set_ylim(self.ylim)
+        ax.set_autoscale_on(False)
+
+        ax.spines['left'].set_position('zero')
+        ax.spines['top'].set_visible(False)
+        ax.spines['right'].set_visible(False)
+
+        ax.set_xlabel('Ratio (Log2)',loc='center')
+        ax.text(0,0.5,'p-value (Log10)',rotation='vertical',transform=ax.transAxes,ha='center',va='center')
+
+        ax.grid(color='#E5E8E8',alpha=0.3,linestyle = 'dashed')
+
+
+    def _layer(self, hollow):
+        # image of the background cloud, drawn once per style on a bare copy of the axes
+        key = (self.background, hollow)
+        if key not in self.layers:
+            fig = Figure(figsize=self.fig.get_size_inches(), dpi=self.fig.dpi)
+            FigureCanvasAgg(fig)
+            fig.patch.set_alpha(0)
+            ax = fig.add_axes(self.ax.get_position())
+            ax.set_axis_off()
+            ax.set_xlim(self.xlim)
+            ax.set_ylim(self.ylim)
+
+            if self.background == 'hexbin':
+                ax.hexbin(self.x, self.y, gridsize=80, mincnt=1, bins='log', cmap='Blues', extent=self.xlim+self.ylim)
+            elif hollow:
+                ax.scatter(self.x, self.y, edgecolor=BACKGROUND_COLOR, s=10, facecolor='none')
+            else:
+                ax.scatter(self.x, self.y, color=BACKGROUND_COLOR, s=12)
+
+            fig.canvas.draw()
+            pixels = np.asarray(fig.canvas.buffer_rgba())
+            x0, y0, x1, y1 = np.round(ax.bbox.extents).astype(int)
+            height = pixels.shape[0]
+            self.layers[key] = pixels[height-y1:height-y0, x0:x1].copy()
+
+        return(self.layers[key])
+
+
+    def clear(self):
+        # remove the highlights, lines, title and legend of the previous plot
+        for artist in self.overlays:
+            artist.remove()
+        self.overlays = []
+        if self.ax.get_legend() is not None:
+            self.ax.get_legend().remove()
+        self.ax.set_title('')
+
+
+    def plot(self, highlights, title, background_label='All proteins identified in pulldown', hollow=False, lines=()):
+        '''
+        draw a plot on the template (the previous plot is cleared)
+        highlights : [(dataframe, color, size, label, x column, y column)], drawn in this order
+        lines : [('h' or 'v', position, text, text x, text y)] threshold lines
+        '''
+        self.clear()
+        ax = self.ax
+
+        layer = ax.imshow(self._layer(hollow), extent=self.xlim+self.ylim, aspect='auto', origin='upper',
+                          interpolation='nearest', zorder=1)
+        # legend marker of the background
+        if hollow:
+            handle = ax.scatter([], [], edgecolor=BACKGROUND_COLOR, s=10, facecolor='none')
+        else:
+            handle = ax.scatter([], [], color=BACKGROUND_COLOR, s=12)
+        handles = [handle]
+        labels = [background_label]
+        self.overlays += [layer, handle]
+
+        for df, color, size, label, x, y in highlights:
+            points = ax.scatter(df[x], df[y], color=color, s=size, zorder=2)
+            handles.append(points)
+            labels.append(label)
+            self.overlays.append(points)
+
+        for direction, position, text, text_x, text_y in lines:
+            if direction == 'h':
+                self.overlays.append(ax.axhline(position,color='#E5E8E8',alpha=0.5))
+            else:
+                self.overlays.append(ax.axvline(position,color='#E5E8E8',alpha=0.5))
+            self.overlays.append(ax.text(text_x,text_y,text,color='#566573',size=9))
+
+        ax.set_xlim(self.xlim)
+        ax.set_ylim(self.ylim)
+        ax.legend(handles,labels,framealpha=0,bbox_to_anchor=(0.315, 0.98))
+        ax.set_title(title)
+
+
+    def render(self, fmt='png'):
+        # the current plot as bytes (png, svg, pdf ...)
+        buffer = io.BytesIO()
+        self.fig.savefig(buffer,transparent=True,format=fmt,bbox_inches='tight')
+        return(buffer.getvalue())
+
+
+    def save(self, path, fmt='png'):
+        # save the current plot, return its bytes
+        content = self.render(fmt)
+        with open(path, 'wb') as f:
+            f.write(content)
+        return(content)
+
+
+    def save_formats(self, stem, formats=('png',)):
+        # save the current plot in each format (stem + '.png', '.svg', '.pdf' ...), return the paths
+        paths = []
+        for fmt in formats:
+            self.save(stem+'.'+fmt, fmt)
+            paths.append(stem+'.'+fmt)
+        return(paths)
+
+
+
+######################################## Batch of volcano plots ########################################
+
+
+def _render_jobs(points, jobs, saving_dir, formats, background):
+    # one template for all the jobs of a worker, only the highlights change between plots
+    volcano = Volcano(points, background)
+    paths = []
+    for job in jobs:
+        volcano.plot(job['highlights'], job['title'], hollow=job.get('hollow', False), lines=job.get('lines', ()))
+        paths.append(volcano.save_formats(os.path.join(saving_dir, job['name']), formats))
+    return(paths)
+
+
+
+def render_batch(pulldown_res, jobs, saving_dir, formats=('png',), workers=1, background='scatter'):
+    '''
+    draw and save many volcano plots of the same pull-down
+    jobs : [{'name' : file name without extension, 'title' : ..., 'highlights' : see Volcano.plot,
+             'lines' : optional threshold lines, 'hollow' : optional}]
+    formats : every plot is saved in each format ('png', 'svg', 'pdf' ...)
+    workers > 1 : jobs are shared between processes, each one draws its own template once
+    returns the saved paths, one list per job, in the jobs' order
+    '''
+    points = pd.DataFrame({X : pulldown_res[X].to_numpy(dtype=float), Y : pulldown_res[Y].to_numpy(dtype=float)})
+    workers = min(workers or os.cpu_count() or 1, len(jobs))
+
+    if workers <= 1:
+        return(_render_jobs(points, jobs, saving_dir, formats, background))
+
+    # job i goes to worker i % workers, results are put back in order
+    chunks = [jobs[w::workers] for w in range(workers)]
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        done = list(pool.map(_render_jobs, itertools.repeat(points), chunks, itertools.repeat(saving_dir),
+                             itertools.repeat(formats), itertools.repeat(background)))
+
+    paths = [None] * len(jobs)
+    for w, chunk_paths in enumerate(done):
+        paths[w::workers] = chunk_paths
+    return(paths)
+
+
+
+def _limits(values, margin=0.05):
+    # matplotlib's default autoscale : data range + 5% on each side
+    values = values[np.isfinite(values)]
+    if not len(values):
+        return((-1.0, 1.0))
+    low, high = float(values.min()), float(values.max())
+    if low == high:
+        low, high = low - 1, high + 1
+    span = high - low
+    return((low - margin*span, high + margin*span))